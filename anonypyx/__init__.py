@@ -1,2 +1,2 @@
 from anonypyx.anonymiser import Anonymiser
-from anonypyx.ksame import kSame
+from anonypyx.ksame import kSame, StreamingkSame
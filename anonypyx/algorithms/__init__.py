@@ -1,7 +1,9 @@
-from anonypyx.algorithms.mondrian import Mondrian
+from anonypyx.algorithms.mondrian import Mondrian, EncodedFrame, Partitioning, SplitTree
+from anonypyx.algorithms.incremental import IncrementalMondrian
 from anonypyx.algorithms.microaggregation import (
     MDAVGeneric,
     RandomChoiceAggregation,
     FMDAV,
+    BlockedMicroaggregation,
 )
 from anonypyx.algorithms.minvariance import MInvariance
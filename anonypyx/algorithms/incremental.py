@@ -0,0 +1,291 @@
+'''
+Maintains a Mondrian partition while records are inserted and deleted. Only the
+subtrees of the partition tree which receive or lose records are partitioned again.
+'''
+import numpy as np
+import pandas as pd
+
+from anonypyx.algorithms.mondrian import EncodedFrame, Mondrian, SplitNode, SplitTree
+
+class IncrementalMondrian:
+    '''
+    Keeps the equivalence classes found by Mondrian valid under batches of inserted and
+    deleted records. Leaves receiving records are partitioned again, which splits them
+    further if the privacy models allow it. Leaves violating a privacy model after an
+    update are merged with their sibling subtree; the records of the merged subtree are
+    partitioned again. Spans are normalised by the spans of the data given to `fit()`.
+
+    The records are kept in memory: the data frames given to `fit()` and `insert()` as they
+    are and their encoding in arrays which grow geometrically. An update only touches the new
+    records and the affected leaves. Deleted records are only unlinked from their equivalence
+    class, so their row labels cannot be reused.
+    '''
+    def __init__(self, privacy_models, feature_columns, **kwargs):
+        '''
+        Constructor.
+
+        Parameters
+        ----------
+        privacy_models : list
+            The privacy models every equivalence class must satisfy. Models which depend
+            on the whole data set, e.g. tCloseness, keep referring to the data they were
+            created with.
+        feature_columns : list of str
+            The names of the quasi-identifier columns.
+        **kwargs
+            Passed on to Mondrian, which partitions the data initially and re-partitions
+            the affected subtrees.
+        '''
+        self._privacy_models = privacy_models
+        self._feature_columns = feature_columns
+        self._mondrian = Mondrian(privacy_models, feature_columns, **kwargs)
+        # data frames are only needed by privacy models which cannot evaluate summaries
+        self._needs_frames = any(not hasattr(model, "is_enforcable_summary") for model in privacy_models)
+        self._chunks = []
+        self._starts = []
+        self._size = 0
+        self._values = {}
+        self._sensitive = {}
+        self._position_of = {}
+        self._tree = None
+        self._positions = {}
+        self._leaf_of = None
+
+    @property
+    def tree(self):
+        '''
+        The SplitTree describing the current partition (None before `fit()`).
+        '''
+        return self._tree
+
+    def fit(self, df):
+        '''
+        Partitions the given data frame with Mondrian. Replaces all records inserted before.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The data frame to partition. Its row labels must be unique.
+
+        Returns
+        -------
+        A list of pandas indices. Each index holds the row labels of one equivalence class.
+        '''
+        if not df.index.is_unique:
+            raise ValueError("The row labels of the records must be unique.")
+
+        data = EncodedFrame.from_frame(df, self._feature_columns, self._mondrian._sensitive_columns())
+        partitions, self._tree = self._mondrian.partition_encoded(data, df, return_tree=True)
+
+        self._chunks = [df]
+        self._starts = [0]
+        self._size = 0
+        self._values = {column: array[:0] for column, array in data.values.items()}
+        self._sensitive = {column: codes[:0] for column, codes in data.sensitive.items()}
+        self._leaf_of = np.empty(0, dtype=object)
+        self._store(data)
+        self._position_of = dict(zip(df.index, range(len(df))))
+        self._positions = {}
+        for leaf, rows in zip(self._tree.leaves, partitions):
+            self._assign(leaf, np.sort(rows))
+        return self.partitions()
+
+    def insert(self, df):
+        '''
+        Adds records to the partition. Every record is routed to its leaf of the partition
+        tree. The leaves receiving records are partitioned again.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The new records. Their row labels must differ from the labels of all records
+            given before. Sensitive values unknown to the data given to `fit()` are not
+            counted by the privacy models.
+        '''
+        if self._tree is None:
+            raise ValueError("fit() must be called before records can be inserted.")
+
+        if not df.index.is_unique or any(label in self._position_of for label in df.index):
+            raise ValueError("The row labels of the records must be unique.")
+
+        data = self._tree.encode(df)
+        offset = self._store(data)
+        self._chunks.append(df)
+        self._starts.append(offset)
+        self._position_of.update(zip(df.index, range(offset, self._size)))
+
+        affected = []
+        for leaf, rows in self._tree.route_encoded(data):
+            rows = rows + offset
+            self._positions[leaf] = np.concatenate([self._positions[leaf], rows])
+            self._leaf_of[rows] = leaf
+            affected.append(leaf)
+
+        for leaf in affected:
+            # leaves merged while restructuring one of the previous leaves are gone
+            if leaf in self._positions:
+                self._restructure(leaf)
+
+    def delete(self, labels):
+        '''
+        Removes records from the partition. A leaf which violates a privacy model afterwards
+        is merged with its sibling subtree.
+
+        Parameters
+        ----------
+        labels : list-like
+            The row labels of the records to remove.
+        '''
+        if self._tree is None:
+            raise ValueError("fit() must be called before records can be deleted.")
+
+        positions = np.array([self._position_of.get(label, -1) for label in labels], dtype=np.int64)
+        if (positions < 0).any():
+            raise KeyError("Unknown row labels cannot be deleted.")
+
+        removed = {}
+        for leaf, position in zip(self._leaf_of[positions], positions):
+            # records with missing values or deleted before do not belong to a leaf
+            if leaf is not None:
+                removed.setdefault(leaf, []).append(position)
+        self._leaf_of[positions] = None
+
+        for leaf, rows in removed.items():
+            self._positions[leaf] = np.setdiff1d(self._positions[leaf], rows)
+
+        for leaf in removed:
+            if leaf not in self._positions:
+                continue
+            data = self._encoded(self._positions[leaf])
+            leaf.summary = data.summarise(data.row_positions())
+            if not self._satisfies(leaf.summary, self._records(self._positions[leaf])):
+                self._restructure(leaf.parent if leaf.parent is not None else leaf)
+
+    def partitions(self):
+        '''
+        Returns the current equivalence classes as a list of pandas indices holding the
+        row labels. The classes are ordered like the leaves of the partition tree.
+        '''
+        return [self._labels(self._positions[leaf]) for leaf in self._tree.leaves]
+
+    def _store(self, data):
+        '''
+        Appends encoded records to the arrays and returns the position of the first one.
+        The arrays double their capacity when they are full, so that a batch costs amortised
+        time proportional to its size.
+        '''
+        offset = self._size
+        self._size += len(data)
+        if self._size > len(self._leaf_of):
+            capacity = max(self._size, 2 * len(self._leaf_of))
+            self._leaf_of = _grown(self._leaf_of, offset, capacity)
+            self._values = {column: _grown(array, offset, capacity) for column, array in self._values.items()}
+            self._sensitive = {column: _grown(codes, offset, capacity) for column, codes in self._sensitive.items()}
+
+        for column, array in self._values.items():
+            array[offset:self._size] = data.values[column]
+        for column, codes in self._sensitive.items():
+            # sensitive columns missing from the records are encoded like missing values
+            codes[offset:self._size] = data.sensitive.get(column, -1)
+        return offset
+
+    def _encoded(self, positions):
+        '''
+        Returns the EncodedFrame of the records at the given positions.
+        '''
+        values = {column: array[positions] for column, array in self._values.items()}
+        sensitive = {column: codes[positions] for column, codes in self._sensitive.items()}
+        return EncodedFrame(values, set(self._tree.categories), sensitive, self._tree.domains, self._tree.categories)
+
+    def _records(self, positions):
+        '''
+        Returns the records at the given positions as a data frame or None if no privacy
+        model needs them.
+        '''
+        if not self._needs_frames:
+            return None
+        parts = self._take(positions, lambda chunk, rows: chunk.iloc[rows])
+        return parts[0] if len(parts) == 1 else pd.concat(parts)
+
+    def _labels(self, positions):
+        parts = self._take(positions, lambda chunk, rows: chunk.index[rows])
+        return parts[0].append(parts[1:]) if len(parts) > 1 else parts[0]
+
+    def _take(self, positions, take):
+        '''
+        Applies take(chunk, rows) to every run of positions which lie in the same chunk
+        and returns the results in the order of the positions.
+        '''
+        if len(positions) == 0:
+            return [take(self._chunks[0], positions)]
+        chunks = np.searchsorted(self._starts, positions, side="right") - 1
+        bounds = np.flatnonzero(np.diff(chunks)) + 1
+        return [
+            take(self._chunks[chunk], rows - self._starts[chunk])
+            for chunk, rows in zip(chunks[np.concatenate(([0], bounds))], np.split(positions, bounds))
+        ]
+
+    def _assign(self, leaf, rows):
+        self._positions[leaf] = rows
+        self._leaf_of[rows] = leaf
+
+    def _restructure(self, node):
+        '''
+        Partitions the records below the given node again. If they form a single leaf
+        violating a privacy model, the records of the parent node are partitioned instead.
+        '''
+        while True:
+            rows = np.sort(np.concatenate([self._positions[leaf] for leaf in _leaves_below(node)]))
+            data = self._encoded(rows)
+            df = self._records(rows)
+            if len(rows) > 0:
+                partitions, subtree = self._mondrian.partition_encoded(data, df, self._tree.scale, return_tree=True)
+                if node.parent is None or not subtree.root.is_leaf or self._satisfies(subtree.root.summary, df):
+                    break
+            elif node.parent is None:
+                # every record was deleted
+                summary = data.summarise(data.row_positions())
+                partitions, subtree = [rows], _single_leaf(self._tree, summary)
+                break
+            node = node.parent
+
+        for leaf in _leaves_below(node):
+            del self._positions[leaf]
+        # Mondrian drops records with a missing value in a split column, those end up
+        # unassigned like the records fit() leaves out
+        self._leaf_of[rows] = None
+        # the leaves of the subtree are numbered like the partitions, a single leaf is replaced by the node
+        leaves = [node] if subtree.root.is_leaf else subtree.leaves
+        self._tree.graft(node, subtree)
+
+        for leaf, partition in zip(leaves, partitions):
+            self._assign(leaf, rows[np.sort(partition)])
+
+    def _satisfies(self, summary, df):
+        for model in self._privacy_models:
+            if hasattr(model, "is_enforcable_summary"):
+                enforceable = model.is_enforcable_summary(summary)
+            else:
+                enforceable = model.is_enforcable(df)
+            if not enforceable:
+                return False
+        return True
+
+def _leaves_below(node):
+    leaves = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if node.is_leaf:
+            leaves.append(node)
+        else:
+            stack.extend((node.right, node.left))
+    return leaves
+
+def _grown(array, size, capacity):
+    grown = np.empty(capacity, dtype=array.dtype)
+    grown[:size] = array[:size]
+    return grown
+
+def _single_leaf(tree, summary):
+    return SplitTree(tree.feature_columns, tree.categories, tree.domains, SplitNode(leaf=0, summary=summary), tree.scale)
@@ -1,13 +1,204 @@
+import os
 import secrets
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import pandas as pd
 import numpy as np
-from scipy.spatial.distance import cdist, pdist, squareform
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import pdist, squareform
 
 
 def categorical_distance(row1, row2):
     return np.sum(row1 != row2)
 
 
+def map_blocks(function, size, block_size, executor=None):
+    """
+    Calls function(start, stop) for consecutive blocks of rows which cover range(size).
+    The blocks are spread over the threads of the executor if one is given. NumPy releases
+    the GIL in its loops, so blocks of a few thousand rows run in parallel.
+    """
+    starts = range(0, size, block_size)
+    if executor is None or len(starts) < 2:
+        for start in starts:
+            function(start, min(start + block_size, size))
+    else:
+        # list() propagates exceptions raised by the workers
+        list(executor.map(lambda start: function(start, min(start + block_size, size)), starts))
+
+
+def mixed_distances(values, codes, centre, centre_codes, block_size=16384, executor=None):
+    """
+    Distances between the records and a point: the euclidean distance between the
+    continuous values plus the number of categorical codes which differ.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Two-dimensional array of the continuous values of the records. The distances are
+        computed in its dtype, e.g. float32.
+    codes : numpy.ndarray
+        Two-dimensional integer array of the category codes of the records. Small integer
+        types keep the comparisons cheap.
+    centre : numpy.ndarray
+        The continuous values of the point.
+    centre_codes : numpy.ndarray
+        The category codes of the point.
+    block_size : int
+        Number of records processed at once. Keeps the temporaries in the cache. (default: 16384)
+    executor : concurrent.futures.ThreadPoolExecutor
+        Threads which process the blocks in parallel. None processes them in the calling
+        thread. (default: None)
+
+    Returns
+    -------
+    A numpy.ndarray holding the distance of every record.
+    """
+    distances = np.empty(len(values), dtype=np.result_type(values.dtype, np.float32))
+
+    def block(start, stop):
+        out = distances[start:stop]
+        difference = values[start:stop] - centre
+        np.einsum("ij,ij->i", difference, difference, out=out)
+        np.sqrt(out, out=out)
+        if codes.shape[1] > 0:
+            out += np.count_nonzero(codes[start:stop] != centre_codes, axis=1)
+
+    map_blocks(block, len(values), block_size, executor)
+    return distances
+
+
+def feature_values(data, feature_columns):
+    """
+    Returns the given columns of a 2-D array as a floating point array. Floating point
+    arrays keep their dtype, e.g. float32, and are not copied if all of their columns are
+    selected in order.
+    """
+    columns = list(feature_columns)
+    values = data if columns == list(range(data.shape[1])) else data[:, columns]
+    if not np.issubdtype(values.dtype, np.floating):
+        values = values.astype(np.float64)
+    return values
+
+
+def take_rows(index, positions):
+    """
+    Returns the row ids of the records at the given positions: the labels of the data
+    frame index, or the positions themselves for plain arrays (index None).
+    """
+    return np.array(positions) if index is None else index.take(positions)
+
+
+def code_dtype(codes):
+    """
+    Returns the smallest signed integer type which holds the codes (and the code -1).
+    """
+    largest = codes.max() if codes.size > 0 else 0
+    return np.promote_types(np.int8, np.min_scalar_type(largest))
+
+
+class RemainingRecords:
+    """
+    The records which have not been assigned to a cluster yet. Holds one or more arrays
+    whose rows correspond to records. Removing records compacts the arrays in place such
+    that the remaining records occupy the first rows in their original order. The live
+    part of an array is accessed by its name, e.g. `remaining["values"]`.
+    """
+
+    def __init__(self, **arrays):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        **arrays : numpy.ndarray
+            Arrays of the same length. The arrays are modified in place.
+        """
+        self.size = len(next(iter(arrays.values())))
+        self.arrays = arrays
+        # position of each row within the original data
+        self.arrays["positions"] = np.arange(self.size)
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, name):
+        return self.arrays[name][:self.size]
+
+    def remove(self, rows):
+        """
+        Removes the records in the given rows.
+
+        Returns
+        -------
+        A tuple of the original positions of the removed records and a boolean mask marking
+        the rows which were kept (indexed by the rows before the removal).
+        """
+        kept = np.ones(self.size, dtype=bool)
+        kept[rows] = False
+        removed = self["positions"][rows]
+
+        new_size = self.size - len(removed)
+        for array in self.arrays.values():
+            array[:new_size] = array[:self.size][kept]
+        self.size = new_size
+        return removed, kept
+
+
+class NearestNeighbourIndex:
+    """
+    KD-tree answering k-nearest-neighbour queries among the records which have not been
+    removed yet. Removed records stay in the tree as tombstones which queries skip. Once
+    the tombstones make up the given fraction of the tree, it is rebuilt from the
+    remaining records.
+    """
+
+    def __init__(self, values, rebuild_fraction=0.5):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Two-dimensional array holding one record per row.
+        rebuild_fraction : float
+            Fraction of removed records which triggers a rebuild of the tree. (default: 0.5)
+        """
+        self.values = values
+        self.rebuild_fraction = rebuild_fraction
+        self.alive = np.ones(len(values), dtype=bool)
+        self.__build(np.arange(len(values)))
+
+    def __build(self, positions):
+        self.positions = positions
+        self.tree = cKDTree(self.values[positions])
+        self.removed = 0
+
+    def remove(self, positions):
+        """
+        Removes the records at the given positions (rows of the original array).
+        """
+        self.alive[positions] = False
+        self.removed += len(positions)
+        if self.removed > self.rebuild_fraction * len(self.positions):
+            self.__build(np.flatnonzero(self.alive))
+
+    def query(self, point, k):
+        """
+        Returns the positions of the k remaining records closest to the point, closest first.
+        """
+        count = k
+        while True:
+            count = min(count, len(self.positions))
+            _, found = self.tree.query(point, k=count)
+            found = self.positions[np.atleast_1d(found)]
+            found = found[self.alive[found]]
+            if len(found) >= k or count == len(self.positions):
+                return found[:k]
+            # too many tombstones among the neighbours
+            count *= 2
+
+
 class MDAVGeneric:
     """
     Implements the MDAV-generic algorithm from [1].
@@ -16,141 +207,215 @@ class MDAVGeneric:
     k-anonymity through microaggregation. Data Mining and Knowledge Discovery, 11, 195–212.
     """
 
-    def __init__(self, k, feature_columns):
+    def __init__(self, k, feature_columns, precompute_distances=False, neighbours="scan",
+                 n_jobs=1, block_size=16384):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        k : int
+            Minimum number of records per cluster.
+        feature_columns : list of str
+            The names of the columns the distances are computed on. If the data is a plain
+            2-D array, the positions of its columns, which are all treated as continuous.
+            The clusters then hold row positions.
+        precompute_distances : bool
+            Whether to compute the full n x n distance matrix up front. Otherwise, the
+            distances from each anchor record to the remaining records are computed when
+            needed, which keeps memory linear in the number of records. Both modes produce
+            the same clusters. (default: False)
+        neighbours : str
+            How the records closest to the second anchor of each iteration are found. "scan"
+            computes the distances to all remaining records, "kd-tree" queries a
+            NearestNeighbourIndex, which is faster for few feature columns. "kd-tree" requires
+            continuous feature columns only. Queries for the most distant records always
+            scan. (default: "scan")
+        n_jobs : int
+            Number of threads computing the distances (see `mixed_distances()`). -1 uses all
+            available cores. (default: 1)
+        block_size : int
+            Number of records per block of the distance computations. (default: 16384)
+        """
+        if neighbours not in ("scan", "kd-tree"):
+            raise ValueError(f"unknown neighbours {neighbours}")
         self.k = k
         self.feature_columns = feature_columns
+        self.precompute_distances = precompute_distances
+        self.neighbours = neighbours
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.block_size = block_size
+        self.executor = None
+        self.neighbour_index = None
         self.clusters = None
+        self.index = None
         self.remaining = None
-        self.remaining_indices = None
         self.categorical = None
         self.continuous = None
+        self.code_offsets = None
+        self.code_counts = None
         self.distance_matrix = None
 
     def partition(self, df):
-        self.__prepare_data(df)
-        self.__build_distance_matrix()
+        if self.n_jobs > 1:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+                self.executor = executor
+                try:
+                    return self._partition(df)
+                finally:
+                    self.executor = None
+        return self._partition(df)
+
+    def _partition(self, df):
+        self._prepare_data(df)
+        self.distance_matrix = None
+        if self.precompute_distances:
+            self._build_distance_matrix()
+        self.neighbour_index = None
+        if self.neighbours == "kd-tree":
+            if self.categorical:
+                raise ValueError("neighbours 'kd-tree' requires continuous feature columns only.")
+            self.neighbour_index = NearestNeighbourIndex(self.remaining["values"].copy())
         self.clusters = []
 
-        while len(self.remaining_indices) >= 3 * self.k:
-            centroid = self.__find_centroid()
-            far_end_dist = self.__get_distance_vector_of_most_distant_point(centroid)
-            self.__assign_closest_points_to_new_cluster(far_end_dist, self.k)
+        while len(self.remaining) >= 3 * self.k:
+            far_end_dist = self._get_distance_vector_of_most_distant_point(self._find_centroid())
+            kept = self._assign_closest_points_to_new_cluster(far_end_dist)
 
-            other_end_dist = (
-                self.__get_distance_vector_of_most_distant_point_from_data_point(
-                    far_end_dist.loc[self.remaining_indices]
-                )
-            )
-            self.__assign_closest_points_to_new_cluster(other_end_dist, self.k)
+            self._assign_nearest_neighbours_to_new_cluster(far_end_dist[kept].argmax())
 
-        if len(self.remaining_indices) >= 2 * self.k:
-            centroid = self.__find_centroid()
-            far_end_dist = self.__get_distance_vector_of_most_distant_point(centroid)
-            self.__assign_closest_points_to_new_cluster(far_end_dist, self.k)
+        if len(self.remaining) >= 2 * self.k:
+            far_end_dist = self._get_distance_vector_of_most_distant_point(self._find_centroid())
+            self._assign_closest_points_to_new_cluster(far_end_dist)
 
-        self.clusters.append(self.remaining_indices)
+        self.clusters.append(take_rows(self.index, self.remaining["positions"]))
         return self.clusters
 
-    def __prepare_data(self, df):
-        self.remaining = df.drop(
-            columns=[
-                column for column in df.columns if column not in self.feature_columns
+    def _prepare_data(self, df):
+        if isinstance(df, np.ndarray):
+            # the columns of plain arrays are continuous
+            self.index = None
+            self.categorical = []
+            self.continuous = list(self.feature_columns)
+            values = feature_values(df, self.continuous)
+        else:
+            self.index = df.index
+            self.categorical = [
+                column for column in self.feature_columns if df[column].dtype == "category"
             ]
-        )
-        self.remaining_indices = self.remaining.index
-        self.categorical = [
-            column
-            for column in self.feature_columns
-            if self.remaining[column].dtype == "category"
-        ]
-        self.continuous = [
-            column
-            for column in self.feature_columns
-            if self.remaining[column].dtype != "category"
-        ]
+            self.continuous = [
+                column for column in self.feature_columns if df[column].dtype != "category"
+            ]
+            values = df[self.continuous].to_numpy(dtype=np.float64).reshape(
+                len(df.index), len(self.continuous)
+            )
 
-        if self.continuous:
-            self.remaining.loc[:, self.continuous] = (
-                self.remaining.loc[:, self.continuous]
-                - self.remaining.loc[:, self.continuous].mean()
-            ) / self.remaining.loc[:, self.continuous].std()
-
-        for attribute in self.categorical:
-            self.remaining.loc[:, attribute] = pd.factorize(
-                self.remaining.loc[:, attribute]
-            )[0]
-
-    def __find_centroid(self):
-        centroid_continuous = (
-            self.remaining.loc[self.remaining_indices, self.continuous].mean()
-            if self.continuous
-            else pd.Series()
-        )
-        modes = (
-            self.remaining.loc[self.remaining_indices, self.categorical].mode()
+        if len(values) > 1:
+            std = values.std(axis=0, ddof=1)
+            # constant columns do not contribute to the distances
+            values = (values - values.mean(axis=0)) / np.where(std > 0, std, 1.0)
+
+        codes = (
+            np.column_stack([pd.factorize(df[column])[0] for column in self.categorical])
             if self.categorical
-            else pd.DataFrame()
+            else np.empty((len(values), 0), dtype=np.intp)
         )
-        centroid_categorical = (
-            np.array(
-                [secrets.choice(modes.loc[:, column].dropna()) for column in modes]
-            )
-            if self.categorical
-            else np.array([])
+        codes = codes.astype(code_dtype(codes))
+        self.remaining = RemainingRecords(values=values, codes=codes)
+
+        # running counts of the remaining codes of all categorical columns in one array:
+        # column i occupies code_offsets[i]:code_offsets[i + 1], its first slot counts missing
+        # values and starts far below zero so that it never holds the maximum
+        sizes = codes.max(axis=0, initial=-1).astype(np.intp) + 2
+        self.code_offsets = np.concatenate(([0], np.cumsum(sizes)))
+        self.code_counts = np.bincount(
+            self._count_slots(codes).ravel(), minlength=self.code_offsets[-1]
+        )
+        self.code_counts[self.code_offsets[:-1]] -= len(codes) + 1
+
+    def _find_centroid(self):
+        return self.remaining["values"].mean(axis=0), self._find_modes()
+
+    def _find_modes(self):
+        if not self.categorical:
+            return np.empty(0, dtype=self.remaining["codes"].dtype)
+        starts = self.code_offsets[:-1]
+        maxima = np.maximum.reduceat(self.code_counts, starts)
+        # slots holding the maximum of their column, grouped by column
+        tied = np.flatnonzero(self.code_counts == np.repeat(maxima, np.diff(self.code_offsets)))
+        first = np.searchsorted(tied, starts)
+        ties = np.diff(np.append(first, len(tied)))
+
+        slots = tied[first]
+        for i in np.flatnonzero(ties > 1):
+            slots[i] = secrets.choice(tied[first[i] : first[i] + ties[i]])
+        modes = slots - starts - 1
+        # columns whose remaining values are all missing
+        modes[maxima <= 0] = -1
+        return modes.astype(self.remaining["codes"].dtype)
+
+    def _count_slots(self, codes):
+        return codes + (self.code_offsets[:-1] + 1)
+
+    def _get_distances(self, position):
+        position_continuous, position_categorical = position
+        return mixed_distances(
+            self.remaining["values"],
+            self.remaining["codes"],
+            position_continuous,
+            position_categorical,
+            self.block_size,
+            self.executor,
         )
-        return centroid_continuous, centroid_categorical
 
-    def __get_distance_vector_of_most_distant_point(self, position):
-        pos_continuous, pos_categorical = position
-        distances = np.zeros(len(self.remaining_indices))
+    def _get_distance_vector_of_most_distant_point(self, position):
+        return self._get_distance_vector_of_record(self._get_distances(position).argmax())
 
+    def _get_distance_vector_of_record(self, row):
+        if self.distance_matrix is not None:
+            return self.distance_matrix[
+                self.remaining["positions"][row], self.remaining["positions"]
+            ]
+        # the record's own values serve as the position to measure from
+        return self._get_distances(
+            (self.remaining["values"][row], self.remaining["codes"][row])
+        )
+
+    def _assign_closest_points_to_new_cluster(self, distance_vector):
+        return self._remove_cluster(np.argpartition(distance_vector, self.k)[: self.k])
+
+    def _assign_nearest_neighbours_to_new_cluster(self, row):
+        if self.neighbour_index is None:
+            return self._assign_closest_points_to_new_cluster(
+                self._get_distance_vector_of_record(row)
+            )
+        positions = self.neighbour_index.query(self.remaining["values"][row], self.k)
+        # the positions of the remaining records are sorted
+        return self._remove_cluster(np.searchsorted(self.remaining["positions"], positions))
+
+    def _remove_cluster(self, rows):
+        """
+        Turns the records in the given rows of the remaining records into a cluster.
+        Returns the mask of the kept rows.
+        """
+        if self.categorical:
+            np.subtract.at(
+                self.code_counts, self._count_slots(self.remaining["codes"][rows]).ravel(), 1
+            )
+        removed, kept = self.remaining.remove(rows)
+        if self.neighbour_index is not None:
+            self.neighbour_index.remove(removed)
+        self.clusters.append(take_rows(self.index, removed))
+        return kept
+
+    def _build_distance_matrix(self):
+        values, codes = self.remaining["values"], self.remaining["codes"]
+        distances = np.zeros(len(values) * (len(values) - 1) // 2)
         if self.continuous:
-            distances += cdist(
-                [pos_continuous.values] if not pos_continuous.empty else [[]],
-                self.remaining.loc[self.remaining_indices, self.continuous].values,
-                metric="euclidean",
-            )[0]
+            distances += pdist(values, metric="euclidean")
         if self.categorical:
-            distances += cdist(
-                [pos_categorical] if len(pos_categorical) > 0 else [[]],
-                self.remaining.loc[self.remaining_indices, self.categorical].values,
-                metric="hamming",
-            )[0] * len(self.categorical)
-
-        max_dist_array_pos = distances.argmax()
-        max_dist_index = self.remaining_indices[max_dist_array_pos]
-        return self.distance_matrix.loc[max_dist_index, self.remaining_indices]
-
-    def __get_distance_vector_of_most_distant_point_from_data_point(
-        self, distance_vector
-    ):
-        max_dist_array_pos = distance_vector.argmax()
-        max_dist_index = self.remaining_indices[max_dist_array_pos]
-        return self.distance_matrix.loc[max_dist_index, self.remaining_indices]
-
-    def __assign_closest_points_to_new_cluster(self, distance_vector, k):
-        array_positions = np.argpartition(distance_vector, k)[:k]
-        indices = self.remaining_indices.take(array_positions)
-        self.remaining_indices = self.remaining_indices.drop(indices)
-        self.clusters.append(indices)
-
-    def __build_distance_matrix(self):
-        dist_continuous = (
-            pdist(self.remaining.loc[:, self.continuous].values, metric="euclidean")
-            if self.continuous
-            else np.zeros(len(self.remaining) * (len(self.remaining) - 1) // 2)
-        )
-        dist_categorical = (
-            pdist(self.remaining.loc[:, self.categorical].values, metric="hamming")
-            * len(self.categorical)
-            if self.categorical
-            else np.zeros(len(self.remaining) * (len(self.remaining) - 1) // 2)
-        )
-        self.distance_matrix = pd.DataFrame(
-            squareform(dist_categorical + dist_continuous),
-            index=self.remaining.index,
-            columns=self.remaining.index,
-        )
+            distances += pdist(codes, metric="hamming") * len(self.categorical)
+        self.distance_matrix = squareform(distances)
 
 
 class FMDAV(MDAVGeneric):
@@ -158,131 +423,63 @@ class FMDAV(MDAVGeneric):
     Implements the Fast MDAV (F-MDAV) algorithm from:
     Rodríguez-Hoyos, A., et al. (2020). The Fast Maximum Distance to Average Vector (F-MDAV):
     An Algorithm for k-Anonymous Microaggregation in Big Data.
-    """
 
-    def __init__(self, k, feature_columns):
-        super().__init__(k, feature_columns)
-        self.precomputed_norms = None
-        self.sum_all = None
-        self.sum_aggregated = None
+    Produces the clusters of MDAVGeneric up to rounding. The standardised continuous
+    columns are stored as float32 and the half squared norm of every record is computed
+    once, so the squared euclidean distance to a point c is obtained from a single dot
+    product: |x - c|^2 = 2 * (|x|^2 / 2 - x.c + |c|^2 / 2). Without categorical columns,
+    |x|^2 / 2 - x.c is enough to compare distances. The centroid is derived from a running
+    sum of the remaining records.
+    """
 
-    def __prepare_data(self, df):
-        super().__prepare_data(df)
-        if self.continuous:
-            self.remaining.loc[:, self.continuous] = self.remaining.loc[
-                :, self.continuous
-            ].astype(np.float32)
-        if self.categorical:
-            self.remaining.loc[:, self.categorical] = self.remaining.loc[
-                :, self.categorical
-            ].astype(np.float32)
-
-        self.precomputed_norms = {
-            "continuous": (
-                0.5 * (self.remaining.loc[:, self.continuous] ** 2).sum(axis=1)
-                if self.continuous
-                else pd.Series(0, index=self.remaining.index, dtype=np.float32)
-            ),
-            "categorical": (
-                0.5 * (self.remaining.loc[:, self.categorical] ** 2).sum(axis=1)
-                if self.categorical
-                else pd.Series(0, index=self.remaining.index, dtype=np.float32)
-            ),
-        }
-
-        self.sum_all = {
-            "continuous": (
-                self.remaining.loc[:, self.continuous].sum(axis=0)
-                if self.continuous
-                else pd.Series(dtype=np.float32)
-            ),
-            "categorical": (
-                self.remaining.loc[:, self.categorical].sum(axis=0)
-                if self.categorical
-                else pd.Series(dtype=np.float32)
-            ),
-        }
-        self.sum_aggregated = {
-            "continuous": (
-                pd.Series(0, index=self.continuous, dtype=np.float32)
-                if self.continuous
-                else pd.Series(dtype=np.float32)
-            ),
-            "categorical": (
-                pd.Series(0, index=self.categorical, dtype=np.float32)
-                if self.categorical
-                else pd.Series(dtype=np.float32)
-            ),
-        }
-
-    def __find_centroid(self):
-        remaining_sum_cont = (
-            self.sum_all["continuous"] - self.sum_aggregated["continuous"]
-            if self.continuous
-            else pd.Series(dtype=np.float32)
-        )
-        remaining_sum_cat = (
-            self.sum_all["categorical"] - self.sum_aggregated["categorical"]
-            if self.categorical
-            else pd.Series(dtype=np.float32)
+    def __init__(self, k, feature_columns, neighbours="scan", n_jobs=1, block_size=16384):
+        super().__init__(k, feature_columns, neighbours=neighbours, n_jobs=n_jobs, block_size=block_size)
+        self.remaining_sum = None
+
+    def _prepare_data(self, df):
+        super()._prepare_data(df)
+        values = self.remaining["values"].astype(np.float32)
+        self.remaining = RemainingRecords(
+            values=values,
+            codes=self.remaining["codes"],
+            half_norms=0.5 * np.einsum("ij,ij->i", values, values),
         )
+        self.remaining_sum = values.sum(axis=0, dtype=np.float64)
 
-        n = len(self.remaining_indices)
-        centroid_continuous = (
-            remaining_sum_cont / n if self.continuous else pd.Series(dtype=np.float32)
-        )
-        modes = (
-            self.remaining.loc[self.remaining_indices, self.categorical].mode()
-            if self.categorical
-            else pd.DataFrame()
-        )
-        centroid_categorical = (
-            np.array(
-                [secrets.choice(modes.loc[:, column].dropna()) for column in modes],
-                dtype=np.float32,
-            )
-            if self.categorical
-            else np.array([], dtype=np.float32)
-        )
-        return centroid_continuous, centroid_categorical
+    def _find_centroid(self):
+        centroid = (self.remaining_sum / len(self.remaining)).astype(np.float32)
+        return centroid, self._find_modes()
 
-    def __get_distance_vector_of_most_distant_point(self, position):
-        pos_continuous, pos_categorical = position
-        distances = np.zeros(len(self.remaining_indices), dtype=np.float32)
+    def _get_distances(self, position):
+        centre, centre_codes = position
+        values, half_norms, codes = (
+            self.remaining["values"], self.remaining["half_norms"], self.remaining["codes"]
+        )
+        distances = np.empty(len(values), dtype=np.float32)
+        half_norm = 0.5 * np.dot(centre, centre)
 
-        if self.continuous:
-            distances += self.precomputed_norms["continuous"].loc[
-                self.remaining_indices
-            ].values - np.dot(
-                self.remaining.loc[self.remaining_indices, self.continuous].values,
-                pos_continuous.values,
-            )
-        if self.categorical:
-            distances += cdist(
-                [pos_categorical] if len(pos_categorical) > 0 else [[]],
-                self.remaining.loc[self.remaining_indices, self.categorical].values,
-                metric="hamming",
-            )[0] * len(self.categorical)
+        def block(start, stop):
+            out = distances[start:stop]
+            np.matmul(values[start:stop], centre, out=out)
+            np.subtract(half_norms[start:stop], out, out=out)
+            if not self.categorical:
+                # ordered like the distances to the centre
+                return
+            out += half_norm
+            out *= 2.0
+            np.maximum(out, 0.0, out=out)
+            np.sqrt(out, out=out)
+            out += np.count_nonzero(codes[start:stop] != centre_codes, axis=1)
 
-        max_dist_array_pos = distances.argmax()
-        max_dist_index = self.remaining_indices[max_dist_array_pos]
-        return self.distance_matrix.loc[max_dist_index, self.remaining_indices]
+        map_blocks(block, len(values), self.block_size, self.executor)
+        return distances
 
-    def __assign_closest_points_to_new_cluster(self, distance_vector, k):
-        array_positions = np.argpartition(distance_vector, k - 1)[:k]
-        indices = self.remaining_indices.take(array_positions)
-        self.remaining_indices = self.remaining_indices.drop(indices)
+    def _assign_closest_points_to_new_cluster(self, distance_vector):
+        return self._remove_cluster(np.argpartition(distance_vector, self.k - 1)[: self.k])
 
-        if self.continuous:
-            self.sum_aggregated["continuous"] += self.remaining.loc[
-                indices, self.continuous
-            ].sum(axis=0)
-        if self.categorical:
-            self.sum_aggregated["categorical"] += self.remaining.loc[
-                indices, self.categorical
-            ].sum(axis=0)
-
-        self.clusters.append(indices)
+    def _remove_cluster(self, rows):
+        self.remaining_sum -= self.remaining["values"][rows].sum(axis=0, dtype=np.float64)
+        return super()._remove_cluster(rows)
 
 
 class RandomChoiceAggregation:
@@ -297,39 +494,198 @@ class RandomChoiceAggregation:
     doi: 10.1109/TKDE.2005.32.
     """
 
-    def __init__(self, k, feature_columns):
+    def __init__(self, k, feature_columns, neighbours="scan"):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        k : int
+            Minimum number of records per cluster.
+        feature_columns : list of str
+            The names of the columns the distances are computed on. If the data is a plain
+            2-D array, the positions of its columns, which are all treated as continuous.
+            The clusters then hold row positions.
+        neighbours : str
+            How the records closest to each randomly chosen record are found. "scan" computes
+            the distances to all remaining records, "kd-tree" queries a NearestNeighbourIndex,
+            which is faster for few feature columns. (default: "scan")
+        """
+        if neighbours not in ("scan", "kd-tree"):
+            raise ValueError(f"unknown neighbours {neighbours}")
         self.k = k
         self.feature_columns = feature_columns
+        self.neighbours = neighbours
+        self.neighbour_index = None
         self.clusters = None
+        self.index = None
         self.remaining = None
-        self.remaining_indices = None
 
     def partition(self, df):
         self.__prepare_data(df)
         self.clusters = []
 
-        while len(self.remaining_indices) >= 2 * self.k:
-            point = self.remaining.loc[self.remaining_indices].sample(n=1)
-            self.__assign_closest_points_to_new_cluster(point, self.k)
+        if self.neighbours == "kd-tree":
+            self.__partition_with_index()
+            return self.clusters
+
+        while len(self.remaining) >= 2 * self.k:
+            row = np.random.randint(len(self.remaining))
+            self.__assign_closest_points_to_new_cluster(row, self.k)
 
-        self.clusters.append(self.remaining_indices)
+        self.clusters.append(take_rows(self.index, self.remaining["positions"]))
         return self.clusters
 
     def __prepare_data(self, df):
-        self.remaining = df.drop(
-            columns=[
-                column for column in df.columns if column not in self.feature_columns
-            ]
-        )
-        self.remaining_indices = self.remaining.index
-
-    def __assign_closest_points_to_new_cluster(self, point, k):
-        distance_vector = cdist(
-            point.values,
-            self.remaining.loc[self.remaining_indices].values,
-            metric="euclidean",
-        )[0]
+        if isinstance(df, np.ndarray):
+            self.index = None
+            # the buffer is compacted in place
+            values = feature_values(df, self.feature_columns).copy()
+        else:
+            self.index = df.index
+            values = df[list(self.feature_columns)].to_numpy(dtype=np.float64)
+        self.remaining = RemainingRecords(values=values)
+
+    def __partition_with_index(self):
+        # the alive mask of the index tracks the remaining records, no compaction needed
+        values = self.remaining["values"]
+        self.neighbour_index = NearestNeighbourIndex(values)
+        remaining = len(values)
+
+        while remaining >= 2 * self.k:
+            # at most half of the tree are tombstones, so few draws are rejected
+            position = self.neighbour_index.positions[np.random.randint(len(self.neighbour_index.positions))]
+            if not self.neighbour_index.alive[position]:
+                continue
+            cluster = self.neighbour_index.query(values[position], self.k)
+            self.neighbour_index.remove(cluster)
+            remaining -= len(cluster)
+            self.clusters.append(take_rows(self.index, cluster))
+
+        self.clusters.append(take_rows(self.index, np.flatnonzero(self.neighbour_index.alive)))
+
+    def __assign_closest_points_to_new_cluster(self, row, k):
+        difference = self.remaining["values"] - self.remaining["values"][row]
+        distance_vector = np.einsum("ij,ij->i", difference, difference)
         array_positions = np.argpartition(distance_vector, k)[:k]
-        indices = self.remaining_indices.take(array_positions)
-        self.remaining_indices = self.remaining_indices.drop(indices)
-        self.clusters.append(indices)
+        removed, _ = self.remaining.remove(array_positions)
+        self.clusters.append(take_rows(self.index, removed))
+
+
+class BlockedMicroaggregation:
+    """
+    Divide-and-conquer microaggregation for large data sets. The records are split into
+    blocks of at most block_size records by recursive median splits like Mondrian's (without
+    privacy models): every split halves a block along the column with the widest span
+    relative to the whole data set. Another microaggregation algorithm then clusters every
+    block independently and the clusters of all blocks are concatenated.
+
+    Every block holds at least k records, so the result is a valid k-anonymous clustering.
+    Clusters cannot cross block borders, which costs some utility compared to clustering all
+    records at once, but the running time grows with n * block_size instead of n^2.
+    """
+
+    def __init__(self, k, feature_columns, block_size=5000, algorithm=None, n_jobs=1):
+        """
+        Constructor.
+
+        Parameters
+        ----------
+        k : int
+            Minimum number of records per cluster.
+        feature_columns : list of str
+            The names of the columns the distances are computed on. If the data is a plain
+            2-D array, the positions of its columns, which are all treated as continuous.
+            The clusters then hold row positions.
+        block_size : int
+            Maximum number of records per block. Must be at least 2 * k. (default: 5000)
+        algorithm : class
+            The microaggregation algorithm run on each block. It is created as
+            algorithm(k, feature_columns). None uses MDAVGeneric. (default: None)
+        n_jobs : int
+            Number of worker processes which cluster blocks in parallel. -1 uses all available
+            cores. (default: 1)
+        """
+        if block_size < 2 * k:
+            raise ValueError("block_size must be at least 2 * k.")
+        self.k = k
+        self.feature_columns = feature_columns
+        self.block_size = block_size
+        self.algorithm = algorithm if algorithm is not None else MDAVGeneric
+        self.n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self.clusters = None
+
+    def partition(self, df):
+        blocks = self._split(df)
+        algorithm = self.algorithm(self.k, self.feature_columns)
+
+        if self.n_jobs > 1 and len(blocks) > 1:
+            # the data is handed to every worker once, the tasks only carry row positions
+            with ProcessPoolExecutor(
+                max_workers=self.n_jobs,
+                initializer=_init_block_worker,
+                initargs=(algorithm, df),
+            ) as pool:
+                results = list(pool.map(_partition_block_in_worker, blocks))
+        else:
+            results = [_partition_block(algorithm, df, block) for block in blocks]
+
+        self.clusters = [cluster for clusters in results for cluster in clusters]
+        return self.clusters
+
+    def _split(self, df):
+        """
+        Returns the row positions of the blocks.
+        """
+        if isinstance(df, np.ndarray):
+            values = feature_values(df, self.feature_columns)
+        else:
+            continuous = [column for column in self.feature_columns if df[column].dtype != "category"]
+            if continuous:
+                values = df[continuous].to_numpy(dtype=np.float64)
+            else:
+                values = np.column_stack(
+                    [pd.factorize(df[column])[0] for column in self.feature_columns]
+                ).astype(np.float64)
+            values = values.reshape(len(df.index), -1)
+
+        if values.shape[1] == 0:
+            return [np.arange(len(values))]
+        spans = values.max(axis=0, initial=0.0) - values.min(axis=0, initial=0.0)
+        scale = np.where(spans > 0, spans, 1.0)
+
+        blocks = []
+        pending = [np.arange(len(values))]
+        while pending:
+            positions = pending.pop()
+            if len(positions) <= self.block_size:
+                blocks.append(positions)
+                continue
+            block = values[positions]
+            column = ((block.max(axis=0) - block.min(axis=0)) / scale).argmax()
+            # splitting by rank keeps both halves at least block_size / 2 >= k records large
+            half = len(positions) // 2
+            order = np.argpartition(block[:, column], half)
+            pending.append(np.sort(positions[order[half:]]))
+            pending.append(np.sort(positions[order[:half]]))
+        return blocks
+
+
+_block_worker_state = None
+
+
+def _init_block_worker(algorithm, df):
+    global _block_worker_state
+    _block_worker_state = (algorithm, df)
+
+
+def _partition_block_in_worker(positions):
+    algorithm, df = _block_worker_state
+    return _partition_block(algorithm, df, positions)
+
+
+def _partition_block(algorithm, df, positions):
+    if isinstance(df, np.ndarray):
+        # the clusters of plain arrays hold positions within the block
+        return [positions[cluster] for cluster in algorithm.partition(df[positions])]
+    return algorithm.partition(df.iloc[positions])
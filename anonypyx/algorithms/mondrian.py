@@ -1,60 +1,977 @@
 '''
-Implements the Mondrian [1] algorithm for multidimensional partitioning.
+Implements the Mondrian [1] algorithm for multidimensional partitioning.
 
 [1]: LeFevre, K., DeWitt, D. J., & Ramakrishnan, R. (2006). Mondrian multidimensional K-anonymity. 22nd International Conference on Data Engineering (ICDE’06), 25–25. https://doi.org/10.1109/ICDE.2006.101
 '''
+import heapq
+import itertools
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from anonypyx import models
+
+class EncodedFrame:
+    '''
+    Column-wise NumPy encoding of the quasi-identifiers of a data frame which
+    Mondrian works on instead of the data frame itself.
+    Categorical columns are stored as their category codes shifted by one such
+    that zero encodes missing values. All other columns are stored as numbers,
+    float64 when encoded from a data frame, with NaN for missing values (including NaT).
+    '''
+    @classmethod
+    def from_frame(cls, df, feature_columns, sensitive_columns=(), categories=None, domains=None):
+        '''
+        Encodes the given quasi-identifiers and sensitive columns of a data frame.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The data frame to encode.
+        feature_columns : list of str
+            The names of the quasi-identifier columns to encode.
+        sensitive_columns : list of str
+            The names of the sensitive columns to encode. (default: empty)
+        categories : dict mapping str to pandas.Index
+            Encodes the given quasi-identifiers as categorical columns with these categories
+            regardless of their dtype. Values outside of the categories are encoded like
+            missing values. Other categorical columns use the categories of their dtype. (default: None)
+        domains : dict mapping str to pandas.Index
+            Domains of the sensitive columns. Derived from the data frame if not given. (default: None)
+        '''
+        values = {}
+        categories = dict(categories) if categories is not None else {}
+
+        for column in feature_columns:
+            series = df[column]
+            if column in categories:
+                values[column] = pd.Categorical(series, categories=categories[column]).codes.astype(np.intp) + 1
+            elif series.dtype.name == "category":
+                values[column] = series.cat.codes.to_numpy().astype(np.intp) + 1
+                categories[column] = series.cat.categories
+            elif pd.api.types.is_datetime64_any_dtype(series) or pd.api.types.is_timedelta64_dtype(series):
+                # NaT is encoded as NaN like other missing values
+                values[column] = np.where(series.isna().to_numpy(), np.nan, series.array.asi8.astype(np.float64))
+            else:
+                values[column] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+
+        if domains is None:
+            domains = {column: models.sensitive_domain(df[column]) for column in sensitive_columns}
+        sensitive = {column: models.encode_sensitive(df[column], domain) for column, domain in domains.items()}
+
+        return EncodedFrame(values, set(categories), sensitive, domains, categories)
+
+    @classmethod
+    def load(cls, directory, mmap_mode="r"):
+        '''
+        Opens an encoded frame stored by `save()`. By default, the columns are memory-mapped
+        instead of being read into memory.
+
+        The directory contains the file metadata.json and one .npy file per column. Data
+        sets which do not fit into memory can be written in this format chunk by chunk,
+        e.g. with numpy.lib.format.open_memmap(). metadata.json holds a dictionary with
+        the keys "columns" (names of the quasi-identifiers, stored as qi_<i>.npy in this order),
+        "categorical" (names of the quasi-identifiers holding shifted category codes),
+        "domains" (maps every sensitive column to the list of its values; the codes of the
+        i-th sensitive column are stored as sensitive_<i>.npy) and optionally "categories"
+        (maps categorical quasi-identifiers to the list of their categories).
+
+        Parameters
+        ----------
+        directory : str
+            The directory holding the encoded frame.
+        mmap_mode : str
+            Passed on to numpy.load(). None reads the columns into memory. (default: "r")
+        '''
+        with open(os.path.join(directory, "metadata.json")) as f:
+            metadata = json.load(f)
+
+        values = {
+            column: np.load(os.path.join(directory, f"qi_{i}.npy"), mmap_mode=mmap_mode)
+            for i, column in enumerate(metadata["columns"])
+        }
+        domains = {column: pd.Index(domain) for column, domain in metadata["domains"].items()}
+        sensitive = {
+            column: np.load(os.path.join(directory, f"sensitive_{i}.npy"), mmap_mode=mmap_mode)
+            for i, column in enumerate(domains)
+        }
+        categories = {column: pd.Index(values) for column, values in metadata.get("categories", {}).items()}
+        return EncodedFrame(values, set(metadata["categorical"]), sensitive, domains, categories)
+
+    def __init__(self, values, categorical, sensitive=None, domains=None, categories=None):
+        '''
+        Constructor.
+
+        Parameters
+        ----------
+        values : dict mapping str to numpy.ndarray
+            Maps each column name to a one-dimensional array holding the encoded column.
+            All arrays must have the same length.
+        categorical : set of str
+            The names of the columns which hold shifted category codes.
+        sensitive : dict mapping str to numpy.ndarray
+            Maps each sensitive column to its codes as returned by `models.encode_sensitive()`. (default: empty)
+        domains : dict mapping str to pandas.Index
+            Maps each sensitive column to its domain. (default: empty)
+        categories : dict mapping str to pandas.Index
+            Maps categorical columns to their categories, the i-th category being encoded
+            as i + 1. Only required to translate split decisions back to values. (default: empty)
+        '''
+        self.values = values
+        self.categorical = categorical
+        self.sensitive = sensitive if sensitive is not None else {}
+        self.domains = domains if domains is not None else {}
+        self.categories = categories if categories is not None else {}
+        self.missing = {
+            column for column, array in values.items()
+            if column not in categorical and _contains_nan(array)
+        }
+        self.num_categories = {
+            column: len(self.categories[column]) + 1 if column in self.categories else int(values[column].max(initial=0)) + 1
+            for column in categorical
+        }
+        # scratch buffer marking the side of a split each row belongs to (allocated on demand)
+        self.side = None
+
+    def __len__(self):
+        return len(next(iter(self.values.values()), ()))
+
+    def save(self, directory):
+        '''
+        Stores the encoded frame in the given directory (see `load()`).
+        '''
+        os.makedirs(directory, exist_ok=True)
+        for i, array in enumerate(self.values.values()):
+            np.save(os.path.join(directory, f"qi_{i}.npy"), array)
+        for i, codes in enumerate(self.sensitive.values()):
+            np.save(os.path.join(directory, f"sensitive_{i}.npy"), codes)
+
+        metadata = {
+            "columns": list(self.values),
+            "categorical": [column for column in self.values if column in self.categorical],
+            "domains": {column: domain.tolist() for column, domain in self.domains.items()},
+            "categories": {column: categories.tolist() for column, categories in self.categories.items()},
+        }
+        with open(os.path.join(directory, "metadata.json"), "w") as f:
+            json.dump(metadata, f)
+
+    def row_positions(self):
+        '''
+        Returns the positions of all rows using the smallest sufficient integer type.
+        '''
+        return np.arange(len(self), dtype=np.int32 if len(self) < 2**31 else np.int64)
+
+    def summarise(self, rows):
+        '''
+        Returns the models.PartitionSummary of the given rows.
+        '''
+        histograms = {
+            column: models.histogram(codes[rows], len(self.domains[column]))
+            for column, codes in self.sensitive.items()
+        }
+        return models.PartitionSummary(len(rows), histograms, self.domains)
 
 class Mondrian:
-    def __init__(self, privacy_models, feature_columns):
+    def __init__(self, privacy_models, feature_columns, n_jobs=1, parallel_threshold=50000, presort=True,
+                 sketch_threshold=None, sketch_size=10000):
+        '''
+        Constructor.
+
+        Parameters
+        ----------
+        privacy_models : list
+            The privacy models every equivalence class must satisfy.
+        feature_columns : list of str
+            The names of the quasi-identifier columns.
+        n_jobs : int
+            Number of worker processes which partition independent subtrees in parallel.
+            -1 uses all available cores. (default: 1)
+        parallel_threshold : int
+            Minimum number of records in a subtree before it is handed to a worker process.
+            Smaller subtrees are partitioned by the calling process. (default: 50000)
+        presort : bool
+            Sorts every numerical column once and carries the sorted positions through the
+            splits so that medians, split points and spans are found by position. Costs one
+            array of positions per numerical column. (default: True)
+        sketch_threshold : int
+            Partitions with more records than this take the split points of numerical columns
+            from the median of an evenly strided sample instead of the exact median. The privacy
+            models are still checked on the exact children. None always uses exact medians.
+            Mainly useful with presort=False. `partition_to_disk()` uses sketch_size instead
+            of None. (default: None)
+        sketch_size : int
+            Number of values sampled for an approximate median. (default: 10000)
+        '''
         self._privacy_models = privacy_models
         self._feature_columns = feature_columns
+        self._n_jobs = os.cpu_count() if n_jobs == -1 else n_jobs
+        self._parallel_threshold = parallel_threshold
+        self._presort = presort
+        self._sketch_threshold = sketch_threshold
+        self._sketch_size = sketch_size
 
-    def _get_spans(self, df, partition, scale=None):
+    def _get_spans(self, data, rows, orders=None, scale=None):
+        if len(data) == 0:
+            # minimum and maximum are undefined, the only partition is empty
+            return {column: 0.0 for column in self._feature_columns}
         spans = {}
         for column in self._feature_columns:
-            if df[column].dtype.name == "category":
-                span = len(df[column][partition].unique())
+            if orders is not None and column in orders and column not in data.missing:
+                # minimum and maximum are the first and last presorted positions
+                order = orders[column]
+                span = data.values[column][order[-1]] - data.values[column][order[0]]
             else:
-                span = (
-                    df[column][partition].max() - df[column][partition].min()
-                )
+                values = data.values[column][rows]
+                if column in data.categorical:
+                    span = np.count_nonzero(np.bincount(values, minlength=data.num_categories[column]))
+                elif column in data.missing:
+                    span = np.nanmax(values) - np.nanmin(values)
+                else:
+                    span = values.max() - values.min()
             if scale is not None:
-                span = span / scale[column]
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    span = np.float64(span) / scale[column]
             spans[column] = span
         return spans
 
-    def _split(self, df, column, partition):
-        dfp = df[column][partition]
-        if dfp.dtype.name == "category":
-            values = dfp.unique()
-            lv = set(values[: len(values) // 2])
-            rv = set(values[len(values) // 2 :])
-            return dfp.index[dfp.isin(lv)], dfp.index[dfp.isin(rv)]
+    def _split(self, data, column, rows, orders=None, sketch_threshold=None):
+        '''
+        Returns the rows of both halves and the split rule: the median for numerical
+        columns or the shifted codes of the categories in the left half. A sketch_threshold
+        of None falls back to the one given to the constructor.
+        '''
+        if sketch_threshold is None:
+            sketch_threshold = self._sketch_threshold
+        median = None
+        if column not in data.categorical and sketch_threshold is not None and len(rows) > sketch_threshold:
+            median = self._approximate_median(data, column, rows)
+
+        if orders is not None and column in orders:
+            return self._split_presorted(data, column, orders[column], median)
+
+        values = data.values[column][rows]
+        if column in data.categorical:
+            # categories in order of their first appearance within the partition
+            codes, first_positions = np.unique(values, return_index=True)
+            codes = codes[np.argsort(first_positions)]
+            left_codes = codes[: len(codes) // 2]
+            in_left = np.zeros(data.num_categories[column], dtype=bool)
+            in_left[left_codes] = True
+            mask = in_left[values]
+            return rows[mask], rows[~mask], left_codes
         else:
-            median = dfp.median()
-            dfl = dfp.index[dfp < median]
-            dfr = dfp.index[dfp >= median]
-            return (dfl, dfr)
+            if median is None:
+                median = np.nanmedian(values) if column in data.missing else np.median(values)
+            return rows[values < median], rows[values >= median], median
 
-    def partition(self, df):
-        scale = self._get_spans(df, df.index)
+    def _approximate_median(self, data, column, rows):
+        step = -(-len(rows) // self._sketch_size)
+        sample = data.values[column][rows[::step]]
+        return np.nanmedian(sample) if column in data.missing else np.median(sample)
 
-        finished_partitions = []
-        partitions = [df.index]
+    def _split_presorted(self, data, column, order, median=None):
+        # returns both halves ordered by value instead of by position
+        values = data.values[column]
+        if column in data.missing:
+            sorted_values = values[order]
+            if median is None:
+                median = np.nanmedian(sorted_values)
+            return order[sorted_values < median], order[sorted_values >= median], median
 
-        while partitions:
-            partition = partitions.pop(0)
-            normalized_spans = self._get_spans(df, partition, scale)
-            for column, span in sorted(normalized_spans.items(), key=lambda x: -x[1]):
-                left_part, right_part = self._split(df, column, partition)
+        count = len(order)
+        high = count
+        if median is None:
+            lower = values[order[(count - 1) // 2]]
+            upper = values[order[count // 2]]
+            median = upper if count % 2 == 1 else (lower + upper) / 2
+            high = count // 2
 
-                if self.__all_models_enforceable(df, left_part, right_part):
-                    partitions.extend((left_part, right_part))
-                    break
+        # the values below the median form a prefix of the sorted positions
+        low = 0
+        while low < high:
+            middle = (low + high) // 2
+            if values[order[middle]] < median:
+                low = middle + 1
             else:
-                finished_partitions.append(partition)
-        return finished_partitions
+                high = middle
+        return order[:low], order[low:], median
+
+    def _distribute(self, data, rows, orders, left_part, right_part):
+        '''
+        Returns the rows in their original order and the presorted positions of both children.
+        '''
+        if orders is None:
+            return (left_part, None), (right_part, None)
+
+        if data.side is None:
+            data.side = np.zeros(len(data), dtype=np.int8)
+        side = data.side
+        side[left_part] = 1
+        side[right_part] = 2
+
+        row_sides = side[rows]
+        order_sides = {column: side[order] for column, order in orders.items()}
+        children = tuple(
+            (
+                rows[row_sides == label],
+                {column: order[order_sides[column] == label] for column, order in orders.items()},
+            )
+            for label in (1, 2)
+        )
+
+        side[rows] = 0
+        return children
+
+    def partition(self, df, return_tree=False, time_budget=None, max_splits=None):
+        '''
+        Partitions the given data frame into equivalence classes satisfying every privacy model.
+
+        Every intermediate state of the recursion is a valid partitioning. If a budget is
+        given, the partitions with the largest normalised span are split first and the
+        partitioning reached when the budget runs out is returned.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The data frame to partition.
+        return_tree : bool
+            Whether to return the SplitTree holding the split decisions as well. (default: False)
+        time_budget : float
+            Number of seconds after which no further split is started. A split which is
+            in progress is finished. None imposes no limit. (default: None)
+        max_splits : int
+            Maximum number of splits. None imposes no limit. (default: None)
+
+        Returns
+        -------
+        A Partitioning: a list of pandas indices, each holding the row labels of one equivalence
+        class. Its attribute completed is False if a budget ran out before every partition was
+        split as far as possible. If return_tree is True, a tuple of this list and the SplitTree
+        whose leaves are numbered like the list is returned instead.
+        '''
+        data = EncodedFrame.from_frame(df, self._feature_columns, self._sensitive_columns())
+        result = self.partition_encoded(
+            data, df, return_tree=return_tree, time_budget=time_budget, max_splits=max_splits
+        )
+
+        partitions = result[0] if return_tree else result
+        labelled = Partitioning((df.index[rows] for rows in partitions), partitions.completed)
+        if not return_tree:
+            return labelled
+        return labelled, result[1]
+
+    def partition_encoded(self, data, df=None, scale=None, return_tree=False, time_budget=None, max_splits=None):
+        '''
+        Partitions encoded data like `partition()` but returns row positions instead of labels.
+
+        Parameters
+        ----------
+        data : EncodedFrame
+            The data to partition. Must hold the sensitive columns of the privacy models.
+        df : pandas.DataFrame
+            The data frame the data was encoded from. Only required by privacy models
+            which do not support `is_enforcable_summary()`. (default: None)
+        scale : dict mapping str to float
+            The spans by which the spans of the quasi-identifiers are normalised, e.g.
+            `SplitTree.scale` of a tree grown on a superset of the data. None uses the
+            spans of the data itself. (default: None)
+        return_tree : bool
+            Whether to return the SplitTree holding the split decisions as well. (default: False)
+        time_budget : float
+            See `partition()`. (default: None)
+        max_splits : int
+            See `partition()`. (default: None)
+
+        Returns
+        -------
+        A Partitioning of numpy arrays. Each array holds the row positions of one equivalence class.
+        If return_tree is True, a tuple of this list and the SplitTree is returned instead.
+        '''
+        root, scale = self._root(data, scale)
+        splits = {} if return_tree else None
+        completed = True
+
+        if time_budget is not None or max_splits is not None:
+            leaves, completed = self._grow_anytime(data, df, scale, root, splits, time_budget, max_splits)
+        elif self._n_jobs > 1 and len(data) >= self._parallel_threshold:
+            leaves = self._grow_parallel(data, df, scale, root, splits)
+        else:
+            leaves = self._grow(data, df, scale, [root], splits)
+
+        # the order in which a breadth-first traversal finishes the partitions
+        leaves.sort(key=lambda leaf: (leaf[0], leaf[1]))
+        partitions = Partitioning((rows for _, _, rows, _ in leaves), completed)
+
+        if not return_tree:
+            return partitions
+        return partitions, SplitTree.build(data, self._feature_columns, splits, leaves, scale)
+
+    def iter_partitions(self, df):
+        '''
+        Partitions the given data frame like `partition()` but yields every equivalence class
+        as soon as it cannot be split any further. The partition tree is traversed depth first,
+        so only the pending siblings along the current path are kept in memory. The classes
+        are yielded in depth-first order (left before right) and always in the calling process.
+        `GeneralisedSchema.iter_generalise()` generalises them while they are yielded.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The data frame to partition.
+
+        Yields
+        ------
+        A pandas index holding the row labels of one equivalence class.
+        '''
+        data = EncodedFrame.from_frame(df, self._feature_columns, self._sensitive_columns())
+        root, scale = self._root(data)
+
+        for _, _, rows, _ in self._iter_leaves(data, df, scale, [root]):
+            yield df.index[rows]
+
+    def partition_to_disk(self, data, filename):
+        '''
+        Partitions encoded data without holding it in memory and writes the result to disk
+        as soon as each equivalence class is finished. Only arrays of row positions are kept
+        in memory. All privacy models must support `is_enforcable_summary()` and use
+        sensitive columns present in the data. The columns are never presorted, whatever
+        the presort setting, since sorting reads every numerical column into memory. Without
+        a sketch_threshold, partitions with more than sketch_size records are split at
+        approximate medians.
+
+        Parameters
+        ----------
+        data : EncodedFrame
+            The data to partition, typically memory-mapped via `EncodedFrame.load()`.
+        filename : str
+            Path of the .npy file to create. It holds one integer per row: the number of
+            the row's equivalence class in the order in which the classes were finished,
+            or -1 for rows with missing values which are not part of any class.
+
+        Returns
+        -------
+        The number of equivalence classes.
+        '''
+        for model in self._privacy_models:
+            if not hasattr(model, "is_enforcable_summary"):
+                raise TypeError("partition_to_disk() requires privacy models which support is_enforcable_summary().")
+
+        sketch_threshold = self._sketch_size if self._sketch_threshold is None else self._sketch_threshold
+        root, scale = self._root(data, presort=False)
+        labels = np.lib.format.open_memmap(filename, mode="w+", dtype=np.int64, shape=(len(data),))
+        labels[:] = -1
+
+        count = 0
+        for _, _, rows, _ in self._iter_leaves(data, None, scale, [root], sketch_threshold=sketch_threshold):
+            labels[rows] = count
+            count += 1
+
+        labels.flush()
+        return count
+
+    def _root(self, data, scale=None, presort=None):
+        all_rows = data.row_positions()
+        orders = None
+        if self._presort if presort is None else presort:
+            orders = {
+                column: np.argsort(data.values[column], kind="stable").astype(all_rows.dtype, copy=False)
+                for column in self._feature_columns if column not in data.categorical
+            }
+        if scale is None:
+            # the slice avoids copying entire columns of memory-mapped data
+            scale = self._get_spans(data, slice(None), orders)
+        return (all_rows, data.summarise(all_rows), 0, 0, orders), scale
+
+    def _split_node(self, data, df, scale, node, normalized_spans=None, sketch_threshold=None):
+        '''
+        Returns the two children of a node in the partition tree together with the split
+        column and rule or None if the node cannot be split. A node is a tuple (rows, summary, depth, path, orders) where path
+        holds the left (0) and right (1) turns from the root as bits and orders maps the
+        numerical columns to the node's positions sorted by value (None if not presorted).
+        '''
+        rows, summary, depth, path, orders = node
+        if len(rows) == 0:
+            return None
+        if normalized_spans is None:
+            normalized_spans = self._get_spans(data, rows, orders, scale)
+        for column, span in sorted(normalized_spans.items(), key=lambda x: -x[1]):
+            left_part, right_part, rule = self._split(data, column, rows, orders, sketch_threshold)
+            left_summary, right_summary = self._summarise_children(data, summary, left_part, right_part)
+
+            if self.__all_models_enforceable(df, left_part, right_part, left_summary, right_summary):
+                left, right = self._distribute(data, rows, orders, left_part, right_part)
+                return (
+                    (left[0], left_summary, depth + 1, path << 1, left[1]),
+                    (right[0], right_summary, depth + 1, (path << 1) | 1, right[1]),
+                    column,
+                    rule,
+                )
+        return None
+
+    def _grow(self, data, df, scale, nodes, splits=None):
+        '''
+        Splits the given nodes recursively and returns the leaves as tuples (depth, path, rows, summary).
+        If splits is a dict, it receives the split column and rule of every inner node keyed by (depth, path).
+        '''
+        return list(self._iter_leaves(data, df, scale, nodes, splits))
+
+    def _iter_leaves(self, data, df, scale, nodes, splits=None, sketch_threshold=None):
+        stack = list(reversed(nodes))
+
+        while stack:
+            node = stack.pop()
+            result = self._split_node(data, df, scale, node, sketch_threshold=sketch_threshold)
+            if result is None:
+                yield node[2], node[3], node[0], node[1]
+                continue
+            left, right, column, rule = result
+            if splits is not None:
+                splits[(node[2], node[3])] = (column, rule)
+            stack.extend((right, left))
+
+    def _grow_anytime(self, data, df, scale, root, splits, time_budget, max_splits):
+        '''
+        Splits the node with the largest normalised span first until no node can be split
+        or the budget runs out. Returns the leaves and whether every node was split as far
+        as possible.
+        '''
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        leaves = []
+        heap = []
+        # the counter keeps the order of nodes with equal spans stable
+        counter = itertools.count()
+
+        def push(node):
+            spans = self._get_spans(data, node[0], node[4], scale)
+            priority = max((span for span in spans.values() if not np.isnan(span)), default=0.0)
+            heapq.heappush(heap, (-priority, next(counter), node, spans))
+
+        push(root)
+        num_splits = 0
+        while heap:
+            if (max_splits is not None and num_splits >= max_splits) or \
+                    (deadline is not None and time.perf_counter() >= deadline):
+                leaves.extend((node[2], node[3], node[0], node[1]) for _, _, node, _ in heap)
+                return leaves, False
+
+            _, _, node, spans = heapq.heappop(heap)
+            result = self._split_node(data, df, scale, node, spans)
+            if result is None:
+                leaves.append((node[2], node[3], node[0], node[1]))
+                continue
+            left, right, column, rule = result
+            if splits is not None:
+                splits[(node[2], node[3])] = (column, rule)
+            num_splits += 1
+            push(left)
+            push(right)
+        return leaves, True
+
+    def _grow_parallel(self, data, df, scale, root, splits=None):
+        leaves = []
+        small, large = [], deque([root])
+
+        # split the top of the tree until there are enough large subtrees to balance the load
+        while large and len(large) < 4 * self._n_jobs:
+            node = large.popleft()
+            result = self._split_node(data, df, scale, node)
+            if result is None:
+                leaves.append((node[2], node[3], node[0], node[1]))
+                continue
+            left, right, column, rule = result
+            if splits is not None:
+                splits[(node[2], node[3])] = (column, rule)
+            for child in (left, right):
+                (large if len(child[0]) >= self._parallel_threshold else small).append(child)
+
+        # the data is handed to every worker once, the tasks only carry row positions
+        with ProcessPoolExecutor(
+            max_workers=self._n_jobs,
+            initializer=_init_worker,
+            initargs=(self, data, df, scale),
+        ) as pool:
+            futures = [pool.submit(_grow_in_worker, node, splits is not None) for node in large]
+            leaves.extend(self._grow(data, df, scale, small, splits))
+            for future in futures:
+                subtree_leaves, subtree_splits = future.result()
+                leaves.extend(subtree_leaves)
+                if splits is not None:
+                    splits.update(subtree_splits)
+        return leaves
+
+    def _sensitive_columns(self):
+        columns = []
+        for model in self._privacy_models:
+            column = getattr(model, "sensitive_column", None)
+            if column is not None and column not in columns:
+                columns.append(column)
+        return columns
+
+    def _summarise_children(self, data, summary, left_part, right_part):
+        if len(left_part) + len(right_part) != summary.count:
+            # rows with missing values in the split column belong to neither child
+            return data.summarise(left_part), data.summarise(right_part)
+        # only the smaller child is counted, the other one is derived from the parent
+        if len(left_part) <= len(right_part):
+            left_summary = data.summarise(left_part)
+            return left_summary, summary - left_summary
+        right_summary = data.summarise(right_part)
+        return summary - right_summary, right_summary
+
+    def __all_models_enforceable(self, df, left_part, right_part, left_summary, right_summary):
+        for model in self._privacy_models:
+            if hasattr(model, "is_enforcable_summary"):
+                enforceable = model.is_enforcable_summary(left_summary) and model.is_enforcable_summary(right_summary)
+            else:
+                enforceable = model.is_enforcable(df.iloc[left_part]) and model.is_enforcable(df.iloc[right_part])
+            if not enforceable:
+                return False
+        return True
+
+class Partitioning(list):
+    '''
+    List of equivalence classes returned by Mondrian. The attribute completed is False
+    if the partitioning was stopped early by a budget (see `Mondrian.partition()`).
+    '''
+    def __init__(self, partitions=(), completed=True):
+        super().__init__(partitions)
+        self.completed = completed
+
+class SplitNode:
+    '''
+    Node of a SplitTree. Inner nodes hold the split column and rule, leaves hold the
+    number of their equivalence class and its models.PartitionSummary.
+    '''
+    def __init__(self, column=None, rule=None, left=None, right=None, leaf=None, summary=None):
+        self.column = column
+        self.rule = rule
+        self.left = left
+        self.right = right
+        self.leaf = leaf
+        self.summary = summary
+        self.parent = None
+        for child in (left, right):
+            if child is not None:
+                child.parent = self
+
+    @property
+    def is_leaf(self):
+        return self.left is None
+
+class SplitTree:
+    '''
+    The split decisions made by Mondrian (see `Mondrian.partition(df, return_tree=True)`).
+    Numerical columns are split at the median: smaller values go to the left child.
+    Categorical columns are split into two sets of categories: the categories listed by
+    the rule go to the left child. Every leaf corresponds to one equivalence class.
+
+    New records are assigned to the leaves by `route()`. Values which are missing or
+    unknown to a categorical split go to the right child unless missing values were
+    seen on its left side; missing numerical values always go to the right child.
+    '''
+    @classmethod
+    def build(cls, data, feature_columns, splits, leaves, scale=None):
+        '''
+        Assembles the tree from the split decisions and leaves recorded while partitioning.
+
+        Parameters
+        ----------
+        data : EncodedFrame
+            The partitioned data.
+        feature_columns : list of str
+            The names of the quasi-identifier columns.
+        splits : dict mapping (int, int) to (str, object)
+            Maps the (depth, path) of every inner node to its split column and rule.
+        leaves : list of tuples (depth, path, rows, summary)
+            The leaves numbered in the order of this list.
+        scale : dict mapping str to float
+            The spans by which Mondrian normalised the spans of the quasi-identifiers. (default: None)
+        '''
+        nodes = {
+            (depth, path): SplitNode(leaf=i, summary=summary)
+            for i, (depth, path, _, summary) in enumerate(leaves)
+        }
+        for key, (column, rule) in splits.items():
+            nodes[key] = SplitNode(column, rule)
+        for (depth, path), node in nodes.items():
+            if node.column is not None:
+                node.left = nodes[(depth + 1, path << 1)]
+                node.right = nodes[(depth + 1, (path << 1) | 1)]
+                node.left.parent = node.right.parent = node
+
+        categories = {column: data.categories[column] for column in feature_columns if column in data.categorical}
+        return SplitTree(feature_columns, categories, data.domains, nodes[(0, 0)], scale)
+
+    @classmethod
+    def from_json_dict(cls, json_dict):
+        '''
+        Returns the SplitTree corresponding to a dictionary created by `to_json_dict()`.
+        '''
+        categories = {column: pd.Index(values) for column, values in json_dict["categories"].items()}
+        domains = {column: pd.Index(values) for column, values in json_dict["domains"].items()}
+
+        nodes = []
+        for description in json_dict["nodes"]:
+            if "leaf" in description:
+                histograms = {column: np.array(counts, dtype=np.int64) for column, counts in description["histograms"].items()}
+                summary = models.PartitionSummary(description["count"], histograms, domains)
+                nodes.append(SplitNode(leaf=description["leaf"], summary=summary))
+            else:
+                column = description["column"]
+                rule = np.array(description["rule"], dtype=np.intp) if column in categories else description["rule"]
+                nodes.append(SplitNode(column, rule))
+        for node, description in zip(nodes, json_dict["nodes"]):
+            if "leaf" not in description:
+                node.left = nodes[description["left"]]
+                node.right = nodes[description["right"]]
+                node.left.parent = node.right.parent = node
+
+        return SplitTree(json_dict["feature_columns"], categories, domains, nodes[0], json_dict.get("scale"))
+
+    def __init__(self, feature_columns, categories, domains, root, scale=None):
+        '''
+        Constructor.
+
+        Parameters
+        ----------
+        feature_columns : list of str
+            The names of the quasi-identifier columns.
+        categories : dict mapping str to pandas.Index
+            Maps the categorical quasi-identifiers to their categories. Categorical rules
+            refer to the categories by their position plus one (zero encodes missing values).
+        domains : dict mapping str to pandas.Index
+            Maps the sensitive columns to their domains.
+        root : SplitNode
+            The root of the tree.
+        scale : dict mapping str to float
+            The spans by which Mondrian normalised the spans of the quasi-identifiers
+            while growing the tree. Required to grow the tree further. (default: None)
+        '''
+        self.feature_columns = list(feature_columns)
+        self.categories = categories
+        self.domains = domains
+        self.root = root
+        self.scale = scale
+        self._changed = set()
+        self._leaves = None
+
+    @property
+    def leaves(self):
+        '''
+        The list of all leaves, numbered in breadth-first order like the partitions returned by Mondrian.
+        '''
+        if self._leaves is None:
+            self._renumber()
+        return self._leaves
+
+    def _renumber(self):
+        self._leaves = []
+        queue = deque([self.root])
+        while queue:
+            node = queue.popleft()
+            if node.is_leaf:
+                node.leaf = len(self._leaves)
+                self._leaves.append(node)
+            else:
+                queue.extend((node.left, node.right))
+
+    def graft(self, node, subtree):
+        '''
+        Replaces a node of this tree by the root of another tree grown on the records of the
+        node, e.g. by `Mondrian.partition_encoded(data, scale=tree.scale, return_tree=True)`.
+        Both trees must encode categories and sensitive values alike. The leaves are renumbered.
+
+        Parameters
+        ----------
+        node : SplitNode
+            The node to replace. It keeps its identity and parent but takes over the split
+            rule, children or summary of the other tree's root.
+        subtree : SplitTree
+            The tree to insert.
+        '''
+        root = subtree.root
+        node.column, node.rule, node.leaf, node.summary = root.column, root.rule, root.leaf, root.summary
+        node.left, node.right = root.left, root.right
+        for child in (node.left, node.right):
+            if child is not None:
+                child.parent = node
+        self._leaves = None
+
+    def to_json_dict(self):
+        '''
+        Returns a dictionary representation of this tree which can be used for serialisation.
+        '''
+        if self._leaves is None:
+            self._renumber()
+        nodes = []
+        positions = {}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            positions[id(node)] = len(nodes)
+            nodes.append(node)
+            if not node.is_leaf:
+                stack.extend((node.right, node.left))
+
+        descriptions = []
+        for node in nodes:
+            if node.is_leaf:
+                descriptions.append({
+                    "leaf": node.leaf,
+                    "count": int(node.summary.count),
+                    "histograms": {column: counts.tolist() for column, counts in node.summary.histograms.items()},
+                })
+            else:
+                rule = node.rule.tolist() if node.column in self.categories else float(node.rule)
+                descriptions.append({
+                    "column": node.column,
+                    "rule": rule,
+                    "left": positions[id(node.left)],
+                    "right": positions[id(node.right)],
+                })
+
+        scale = None if self.scale is None else {column: float(span) for column, span in self.scale.items()}
+        return {
+            "feature_columns": self.feature_columns,
+            "scale": scale,
+            "categories": {column: values.tolist() for column, values in self.categories.items()},
+            "domains": {column: values.tolist() for column, values in self.domains.items()},
+            "nodes": descriptions,
+        }
+
+    def route(self, df):
+        '''
+        Assigns the rows of a data frame to the leaves of this tree.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The data frame. Must contain the quasi-identifier columns of the tree.
+
+        Returns
+        -------
+        A numpy.ndarray holding the number of the leaf of every row.
+        '''
+        return self._route(self.encode(df))
+
+    def add(self, df):
+        '''
+        Routes the rows of a data frame to the leaves of this tree and adds them to the
+        leaves' summaries. Leaves receiving rows are checked by the next call to `revalidate()`.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The data frame. Must contain the quasi-identifier and sensitive columns of the tree.
+
+        Returns
+        -------
+        A numpy.ndarray holding the number of the leaf of every row.
+        '''
+        data = self.encode(df)
+        labels = self._route(data)
+        changed, inverse = np.unique(labels, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(changed))
+
+        histograms = {}
+        for column, codes in data.sensitive.items():
+            size = len(self.domains[column]) + 1
+            joint = np.bincount(inverse * size + codes + 1, minlength=len(changed) * size)
+            histograms[column] = joint.reshape(len(changed), size)[:, 1:]
+
+        for i, leaf in enumerate(changed):
+            node = self.leaves[leaf]
+            added = models.PartitionSummary(int(counts[i]), {column: h[i] for column, h in histograms.items()}, self.domains)
+            node.summary = node.summary + added
+            self._changed.add(node)
+        return labels
+
+    def revalidate(self, privacy_models):
+        '''
+        Checks the privacy models on the summaries of all leaves which changed since the
+        tree was created or last revalidated. The models must support `is_enforcable_summary()`.
+
+        Parameters
+        ----------
+        privacy_models : list
+            The privacy models every equivalence class must satisfy.
+
+        Returns
+        -------
+        The sorted list of the numbers of the changed leaves which violate at least one model.
+        '''
+        # nodes which were replaced by grafting are no longer leaves
+        leaves = sorted(node.leaf for node in self._changed if node.is_leaf and self.leaves[node.leaf] is node)
+        violations = [
+            leaf for leaf in leaves
+            if not all(model.is_enforcable_summary(self.leaves[leaf].summary) for model in privacy_models)
+        ]
+        self._changed.clear()
+        return violations
+
+    def encode(self, df):
+        '''
+        Returns the EncodedFrame of a data frame using the categories and sensitive domains of
+        this tree. Sensitive columns missing from the data frame are skipped.
+        '''
+        sensitive_columns = [column for column in self.domains if column in df.columns]
+        domains = {column: self.domains[column] for column in sensitive_columns}
+        return EncodedFrame.from_frame(df, self.feature_columns, sensitive_columns, self.categories, domains)
+
+    def route_encoded(self, data):
+        '''
+        Assigns the rows of encoded data (see `encode()`) to the leaves of this tree.
+
+        Yields
+        ------
+        Tuples (leaf, rows) of every SplitNode receiving rows and the positions of these rows.
+        '''
+        stack = [(self.root, np.arange(len(data)))]
+
+        while stack:
+            node, rows = stack.pop()
+            if len(rows) == 0:
+                continue
+            if node.is_leaf:
+                yield node, rows
+                continue
+
+            values = data.values[node.column][rows]
+            if node.column in self.categories:
+                in_left = np.zeros(data.num_categories[node.column], dtype=bool)
+                in_left[node.rule] = True
+                mask = in_left[values]
+            else:
+                mask = values < node.rule
+            stack.append((node.right, rows[~mask]))
+            stack.append((node.left, rows[mask]))
+
+    def _route(self, data):
+        labels = np.full(len(data), -1, dtype=np.int64)
+        if self._leaves is None:
+            self._renumber()
+        for node, rows in self.route_encoded(data):
+            labels[rows] = node.leaf
+        return labels
+
+def _contains_nan(array, chunk_size=2**24):
+    if not np.issubdtype(array.dtype, np.floating):
+        return False
+    # chunks bound the temporary memory for memory-mapped columns
+    return any(np.isnan(array[i:i + chunk_size]).any() for i in range(0, len(array), chunk_size))
+
+_worker_state = None
 
-    def __all_models_enforceable(self, df, left_part, right_part):
-        return all(model.is_enforcable(df.loc[left_part]) and model.is_enforcable(df.loc[right_part]) for model in self._privacy_models)
+def _init_worker(mondrian, data, df, scale):
+    global _worker_state
+    _worker_state = (mondrian, data, df, scale)
 
+def _grow_in_worker(node, record_splits):
+    mondrian, data, df, scale = _worker_state
+    splits = {} if record_splits else None
+    return mondrian._grow(data, df, scale, [node], splits), splits
@@ -1,10 +1,11 @@
-from anonypyx import generalisation, models, algorithms
+from anonypyx import generalisation, models, algorithms, feasibility
 
 class Anonymiser:
     def __init__(self, df, **kwargs):
         '''
         Creates a new Anonymiser instance.  
-        Checks whether the given configuration options are valid.
+        Checks whether the given configuration options are valid. The parameter ranges the
+        data set admits are stored as the attribute feasibility (see `feasibility.analyse()`).
 
         Parameters
         ----------
@@ -30,10 +31,22 @@ class Anonymiser:
                 Parameter t of t-closeness. Setting this to None deactivates t-closeness. (default: None)
             diversity_definition : str
                 Instantiation of l-diversity principle to use. Can be either "distinct", "simple", "entropy" or "recursive". (default: "distinct")
+            c : float
+                Parameter c of recursive (c,l)-diversity. Must be set when diversity_definition is "recursive". (default: None)
             closeness_metric : str
-                Distance metric used by t-closeness. Can be either "max distance" or "earth mover's distance". (default: "max distance")
+                Distance metric used by t-closeness. Can be either "max distance" or "earth mover's distance".
+                The earth mover's distance treats categorical sensitive values as equally distant and
+                numerical ones as ordered. (default: "max distance")
             algorithm : str
-                The anonymisation algorithm to use. Can be either "Mondrian" or "MDAV-generic" (supports only k-anonymity). (default: "Mondrian")
+                The anonymisation algorithm to use. Can be either "Mondrian", "MDAV-generic", "F-MDAV" or "MDAV-blocked"
+                (the latter three support only k-anonymity). "F-MDAV" produces the clusters of "MDAV-generic" considerably faster.
+                "MDAV-blocked" runs "MDAV-generic" on blocks of at most 5000 records (see `algorithms.BlockedMicroaggregation`),
+                trading some utility for scaling to millions of records. (default: "Mondrian")
+            n_jobs : int
+                Number of worker processes used by Mondrian to partition independent subtrees in parallel,
+                number of threads computing the distances of "MDAV-generic" and "F-MDAV", or number of
+                worker processes clustering the blocks of "MDAV-blocked".
+                -1 uses all available cores. (default: 1)
 
         Raises
         ------
@@ -50,8 +63,10 @@ class Anonymiser:
         l = kwargs.get("l", None)
         t = kwargs.get("t", None)
         l_diversity_definition = kwargs.get("diversity_definition", "distinct")
+        c = kwargs.get("c", None)
         t_closeness_metric = kwargs.get("closeness_metric", "max distance")
         algorithm = kwargs.get("algorithm", "Mondrian")
+        n_jobs = kwargs.get("n_jobs", 1)
         # aggregations = {}
         generalisation_strategy = kwargs.get("generalisation_strategy", "machine-readable")
         generalisation_strategy_type = None
@@ -76,17 +91,27 @@ class Anonymiser:
     
         if type(l_diversity_definition) is not str:
             raise TypeError("diversity_definition must be a string.")
+
+        if (c is not None) and (type(c) not in (int, float)):
+            raise TypeError("c must be a number.")
         
         if type(algorithm) is not str:
             raise TypeError("algorithm must be a string")
+
+        if type(n_jobs) is not int:
+            raise TypeError("n_jobs must be an integer.")
     
         if k < 1 or k > len(df.index):
             raise ValueError("k must be between 1 and the number of records.")
     
+        if n_jobs < 1 and n_jobs != -1:
+            raise ValueError("n_jobs must be positive or -1.")
+
         if (l is not None) and (l < 1):
             raise ValueError("l must be greater than 1.")
-    
-        # TODO: feasibility check for large l values?
+
+        if (c is not None) and (c <= 0):
+            raise ValueError("c must be positive.")
     
         if (t is not None) and (t < 0 or t > 1):
             raise ValueError("t must be between 0 and 1.")
@@ -105,29 +130,45 @@ class Anonymiser:
             elif l_diversity_definition == "simple":
                 raise NotImplementedError("Simple l-diversity has not been implemented yet.")
             elif l_diversity_definition == "entropy":
-                raise NotImplementedError("Entropy l-diversity has not been implemented yet.")
+                privacy_models.append(models.EntropyLDiversity(l, sensitive_attribute))
             elif l_diversity_definition == "recursive":
-                raise NotImplementedError("Recursive (c,l)-diversity has not been implemented yet.")
+                if c is None:
+                    raise ValueError("c must be set for recursive (c,l)-diversity.")
+                privacy_models.append(models.RecursiveCLDiversity(c, l, sensitive_attribute))
             else:
                 raise ValueError("diversity_definition does not match any known instantiation of the l-diversity principle.")
     
+        metric = models.max_distance_metric
+        if t_closeness_metric == "earth mover's distance":
+            if sensitive_attribute is not None and df[sensitive_attribute].dtype.name != "category":
+                metric = models.earth_movers_distance_ordered
+            else:
+                metric = models.earth_movers_distance_categorical
+
         if t is not None:
-            if t_closeness_metric == "max distance":
-                privacy_models.append(models.tCloseness(t, df, sensitive_attribute, models.max_distance_metric))
-            elif t_closeness_metric == "earth mover's distance":
-                if not all(df[qi].dtype.name == "category" for qi in quasi_identifiers):
-                    raise NotImplementedError("Earth mover's distance has not been implemented for numerical attributes yet.")
-                privacy_models.append(models.tCloseness(t, df, sensitive_attribute, models.earth_movers_distance_categorical))
+            if t_closeness_metric in ("max distance", "earth mover's distance"):
+                privacy_models.append(models.tCloseness(t, df, sensitive_attribute, metric))
+
+        self.feasibility = feasibility.analyse(
+            df, k, sensitive_attribute, l, l_diversity_definition, c, t, metric
+        )
+        if (l is not None) and (l > self.feasibility.max_l):
+            raise ValueError(f"l must not exceed {self.feasibility.max_l}, the largest l the data set satisfies.")
     
         if algorithm == "Mondrian":
-            self.algorithm = algorithms.Mondrian(privacy_models, quasi_identifiers)
-        elif algorithm == "MDAV-generic":
+            self.algorithm = algorithms.Mondrian(privacy_models, quasi_identifiers, n_jobs=n_jobs)
+        elif algorithm in ("MDAV-generic", "F-MDAV", "MDAV-blocked"):
             if l is not None:
-                raise ValueError("algorithm 'MDAV-generic' does not support l-diversity.")
+                raise ValueError(f"algorithm '{algorithm}' does not support l-diversity.")
             if t is not None:
-                raise ValueError("algorithm 'MDAV-generic' does not support t-closeness.")
+                raise ValueError(f"algorithm '{algorithm}' does not support t-closeness.")
     
-            self.algorithm = algorithms.MDAVGeneric(k, quasi_identifiers)
+            if algorithm == "MDAV-generic":
+                self.algorithm = algorithms.MDAVGeneric(k, quasi_identifiers, n_jobs=n_jobs)
+            elif algorithm == "F-MDAV":
+                self.algorithm = algorithms.FMDAV(k, quasi_identifiers, n_jobs=n_jobs)
+            else:
+                self.algorithm = algorithms.BlockedMicroaggregation(k, quasi_identifiers, n_jobs=n_jobs)
         self.df = df
         self.quasi_identifiers = quasi_identifiers
         self.sensitive_attribute = sensitive_attribute
@@ -0,0 +1,132 @@
+'''
+Fast feasibility analysis of privacy parameters on the whole data set. It needs a single
+pass over the sensitive column and runs before any partitioning algorithm.
+'''
+import numpy as np
+
+from anonypyx import models
+
+class FeasibilityReport:
+    '''
+    Parameter ranges a data set admits.
+
+    Attributes
+    ----------
+    max_k : int
+        The largest k: the number of records.
+    max_l : int
+        The largest l of the chosen l-diversity definition which the whole data set satisfies.
+        Since the definitions are preserved when equivalence classes are merged, no
+        partitioning satisfies a larger l. 0 if there is no sensitive column.
+    min_t : float
+        The distance between the global distribution of the sensitive values and the closest
+        distribution a class of max(k, l) records can have. Smaller values of t force every
+        equivalence class to be larger. None if there is no sensitive column.
+    estimated_classes : int
+        An upper estimate of the number of equivalence classes for the given parameters.
+    '''
+    def __init__(self, max_k, max_l, min_t, estimated_classes):
+        self.max_k = max_k
+        self.max_l = max_l
+        self.min_t = min_t
+        self.estimated_classes = estimated_classes
+
+def analyse(df, k=1, sensitive_column=None, l=None, diversity_definition="distinct", c=None, t=None,
+            distance_metric=models.max_distance_metric):
+    '''
+    Analyses which privacy parameters the given data set admits.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The data set to anonymise.
+    k : int
+        Parameter k of k-anonymity. (default: 1)
+    sensitive_column : str
+        The name of the sensitive column. (default: None)
+    l : int
+        Parameter l of l-diversity. None if l-diversity is not applied. (default: None)
+    diversity_definition : str
+        Either "distinct", "simple", "entropy" or "recursive". Determines max_l. (default: "distinct")
+    c : float
+        Parameter c of recursive (c,l)-diversity. (default: None)
+    t : float
+        Parameter t of t-closeness. None if t-closeness is not applied. (default: None)
+    distance_metric : callable
+        The distance metric of t-closeness (see `models.distance()`). (default: models.max_distance_metric)
+
+    Returns
+    -------
+    A FeasibilityReport.
+    '''
+    num_records = len(df.index)
+    min_size = max(k, l or 1)
+    estimated_classes = num_records // min_size
+
+    if sensitive_column is None:
+        return FeasibilityReport(num_records, 0, None, max(estimated_classes, 1) if l is None else 1)
+
+    domain = models.sensitive_domain(df[sensitive_column])
+    counts = models.histogram(models.encode_sensitive(df[sensitive_column], domain), len(domain))
+    global_frequencies = counts / float(num_records)
+
+    # counts of the values present in the data, in descending order
+    present = -np.sort(-counts[counts > 0])
+    missing = num_records - int(counts.sum())
+    max_l = _max_l(present, missing, diversity_definition, c)
+
+    if l is not None and l > 1 and len(present) > 0:
+        # every class holds at least l - 1 records which differ from the most frequent value
+        estimated_classes = min(estimated_classes, (num_records - int(present[0])) // (l - 1))
+
+    # the ordered earth mover's distance compares cumulative distributions
+    ordered = distance_metric is models.earth_movers_distance_ordered
+    min_t = models.distance(distance_metric, _closest_distribution(global_frequencies, min_size, ordered), global_frequencies, domain)
+
+    if t is not None:
+        # classes grow until their closest distribution is within t of the global one
+        size = min_size
+        while size < num_records and models.distance(
+            distance_metric, _closest_distribution(global_frequencies, size, ordered), global_frequencies, domain
+        ) > t:
+            size *= 2
+        estimated_classes = min(estimated_classes, num_records // min(size, num_records))
+
+    return FeasibilityReport(num_records, max_l, float(min_t), max(estimated_classes, 1))
+
+def _max_l(present, missing, diversity_definition, c):
+    if diversity_definition == "distinct":
+        # like DistinctLDiversity, missing values count as one more distinct value
+        return len(present) + (missing > 0)
+    if len(present) == 0:
+        return 0
+    if diversity_definition == "entropy":
+        p = present / present.sum()
+        return int(np.floor(np.exp(-np.dot(p, np.log(p))) + 1e-9))
+    if diversity_definition == "recursive":
+        if c is None:
+            return 0
+        # for l >= 2, the tail r_l + ... + r_m is the total minus the l - 1 largest counts
+        tails = present.sum() - np.concatenate(([0], np.cumsum(present)[:-1]))
+        return int(np.count_nonzero(present[0] < c * tails))
+    return len(present)
+
+def _closest_distribution(frequencies, size, ordered=False):
+    '''
+    Rounds the frequencies to multiples of 1 / size by the largest remainder method. If ordered
+    is True, the cumulative frequencies are rounded instead: every cumulative count then lies as
+    close as possible to its exact value, which minimises the ordered earth mover's distance.
+    '''
+    total = frequencies.sum()
+    if total == 0:
+        return frequencies
+    if ordered:
+        # rounding is monotone, so the rounded cumulative counts never decrease
+        cumulative = np.round(np.cumsum(frequencies) / total * size)
+        return np.diff(cumulative, prepend=0.0) / size
+    exact = frequencies / total * size
+    counts = np.floor(exact)
+    remaining = int(size - counts.sum())
+    if remaining > 0:
+        counts[np.argpartition(counts - exact, remaining - 1)[:remaining]] += 1
+    return counts / size
@@ -170,17 +170,19 @@ class GlobalRecoding(GeneralisedSchema):
 
         return cardinality
 
-    def _generalise_quasi_identifiers(self, df, partitions):
+    def _generalise_quasi_identifiers(self, df, labels, num_groups):
         # added for the sake of completeness
         # rather time consuming algorithm
         # global recoding should be used with dedicated algorithms if possible
         columns = self.quasi_identifier()
         data = {col: [] for col in columns}
+        inside = labels >= 0
         for column in columns:
             replacements = []
+            values_per_group = df.loc[inside, column].groupby(labels[inside]).unique()
 
-            for i, partition in enumerate(partitions):
-                value_this = self._generalisation_of(column, df.loc[partition][column].unique())
+            for i in range(num_groups):
+                value_this = self._generalisation_of(column, values_per_group[i])
                 node_this = self._qi_taxonomies[column].find_value(value_this)
 
                 # invariant: there is at most one distinct value on the same root-leaf-path as value_this
@@ -197,7 +199,7 @@ class GlobalRecoding(GeneralisedSchema):
                 replacements.append(value_this)
 
             data[column] = replacements
-            data['group_id'] = range(len(partitions))
+            data['group_id'] = range(num_groups)
 
         columns.append('group_id')
 
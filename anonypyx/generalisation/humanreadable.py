@@ -150,26 +150,26 @@ class HumanReadable(GeneralisedSchema):
         overlap = r_set.intersection(query_predicate)
         return len(overlap)
 
-    def _generalise_partition(self, df):
-        row = []
-        for col in self._integer:
-            row.append(self._to_string_interval(df[col]))
+    def _generalise_groups(self, df, labels):
+        groups = df.groupby(labels)
+        result = pd.DataFrame(index=groups.size().index)
+
+        if self._integer:
+            minimum = groups[self._integer].min()
+            maximum = groups[self._integer].max()
+            for col in self._integer:
+                low = minimum[col].astype(str)
+                high = maximum[col].astype(str)
+                result[col] = high.where(minimum[col] == maximum[col], low + "-" + high)
 
         for col in self._categorical:
-            row.append(self._to_string_set(df[col]))
-        return row
-
-    def _to_string_interval(self, series):
-        minimum = series.min()
-        maximum = series.max()
-        if maximum == minimum:
-            return str(maximum)
-        return f"{minimum}-{maximum}"
-
-    def _to_string_set(self, series):
-        l = [str(value) for value in series.unique()]
-        l.sort()
-        return ",".join(l)
+            result[col] = self._to_string_sets(df[col], labels)
+        return result[self.quasi_identifier()]
+
+    def _to_string_sets(self, series, labels):
+        # the sorted distinct values of every group joined by commas
+        values = pd.DataFrame({'group': labels, 'value': series.astype(str).to_numpy()}).drop_duplicates()
+        return values.sort_values(['group', 'value']).groupby('group')['value'].agg(",".join)
 
     def _parse_interval(self, interval_str):
         match = re.match(r"^(-?\d+)(?:-(-?\d+))?$", interval_str)
@@ -73,17 +73,14 @@ class MachineReadable(GeneralisedSchema):
 
         return qi
 
-    def _generalise_partition(self, df):
-        row = []
-        for interval in self._intervals.values():
-            row.append(df[interval[0]].min())
-            row.append(df[interval[1]].max())
-
-        for one_hot_set in self._one_hot_sets.values():
-            for one_hot_col in one_hot_set:
-                row.append(df[one_hot_col].max())
-
-        return row
+    def _generalise_groups(self, df, labels):
+        groups = df.groupby(labels)
+        minimum = groups[[interval[0] for interval in self._intervals.values()]].min()
+        maximum = groups[
+            [interval[1] for interval in self._intervals.values()]
+            + [one_hot_col for one_hot_set in self._one_hot_sets.values() for one_hot_col in one_hot_set]
+        ].max()
+        return pd.concat([minimum, maximum], axis=1)[self.quasi_identifier()]
 
     def match(self, df, record, on):
         query = []
@@ -36,8 +36,6 @@ class Microaggregation(GeneralisedSchema):
     def quasi_identifier(self):
         return self._integer
 
-    def _generalise_partition(self, df):
-        row = []
-        for col in self._integer:
-            row.append(df[col].astype(float).mean())  # Convert to float before computing mean
-        return row
+    def _generalise_groups(self, df, labels):
+        # convert to float before computing the means
+        return df[self._integer].astype(float).groupby(labels).mean()
@@ -44,13 +44,19 @@ class RawData(schema.GeneralisedSchema):
     def generalise(self, df, partitions):
         # dirty workaround, but serves its purpose:
         # overwrite the method to skip generalisation of
-        # quasi-identifiers (the usual way of overwriting _generalise_partition()
+        # quasi-identifiers (the usual way of overwriting _generalise_groups()
         # is not possible here because the method must return exactly one 
         # generalised quasi-identifier per partition)
         partitions = [[i for p in partitions for i in p]]
-        df = self._count_unique_unaltered_values(df, partitions)
+        labels, num_groups = schema.partition_labels(df, partitions)
+        df = self._count_unique_unaltered_values(df, labels, num_groups)
         return df.drop('group_id', axis=1)
 
+    def iter_generalise(self, df, partitions, chunk_size=1000):
+        # identical records of different partitions are counted together,
+        # so the output is only known once all partitions are
+        yield self.generalise(df, partitions)
+
     def match(self, df, record, on):
         query = []
         for column in on:
@@ -1,3 +1,6 @@
+import itertools
+
+import numpy as np
 import pandas as pd
 
 def build_column_groups(df, quasi_identifiers):
@@ -74,18 +77,58 @@ class GeneralisedSchema:
         df : pandas.DataFrame
             The data frame to generalise. Its column must match those provided when
             creating the instance from which this method is called.
-        partitions : list of pandas indices
+        partitions : iterable of pandas indices
             Each index in the list defines a subset of rows from the data frame
-            which will be generalised. The subsets must not overlap.
+            which will be generalised. The subsets must not overlap. Generators
+            such as `Mondrian.iter_partitions()` are accepted as well, but are
+            consumed entirely before generalising (see `iter_generalise()`).
 
         Returns
         -------
         A pandas.DataFrame which has been generalised according to this schema.
         '''
         df = self._preprocess(df.copy())
+        labels, num_groups = partition_labels(df, partitions)
+        return self._generalise_labelled(df, labels, num_groups)
 
-        part_1 = self._generalise_quasi_identifiers(df, partitions)
-        part_2 = self._count_unique_unaltered_values(df, partitions)
+    def iter_generalise(self, df, partitions, chunk_size=1000):
+        '''
+        Generalises the given data frame like `generalise()` but consumes the partitions
+        lazily. The generalised rows of every chunk_size partitions are yielded as soon as
+        the chunk is complete, so that generalising and writing the output overlap with
+        partitioning if partitions is a generator such as `Mondrian.iter_partitions()`.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The data frame to generalise (see `generalise()`).
+        partitions : iterable of pandas indices
+            The partitions (see `generalise()`).
+        chunk_size : int
+            The number of partitions generalised together. (default: 1000)
+
+        Yields
+        ------
+        A pandas.DataFrame holding the generalised rows of a chunk of partitions. Concatenated,
+        the data frames hold the rows returned by `generalise()`.
+        '''
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive.")
+
+        df = self._preprocess(df.copy())
+        partitions = iter(partitions)
+        while True:
+            chunk = list(itertools.islice(partitions, chunk_size))
+            if len(chunk) == 0:
+                return
+            positions, labels = partition_positions(df, chunk)
+            # the rows keep their order in the data frame like in generalise()
+            order = np.argsort(positions, kind="stable")
+            yield self._generalise_labelled(df.iloc[positions[order]], labels[order], len(chunk))
+
+    def _generalise_labelled(self, df, labels, num_groups):
+        part_1 = self._generalise_quasi_identifiers(df, labels, num_groups)
+        part_2 = self._count_unique_unaltered_values(df, labels, num_groups)
 
         generalised_df = part_1.merge(part_2, on='group_id')
 
@@ -176,7 +219,7 @@ class GeneralisedSchema:
         '''
         Overwrite this method in subclasses.
         It must return the list of column names corresponding to the new quasi-identifiers.
-        Ensure that the order is the same as returned by _generalise_partition()!
+        Ensure that the order is the same as returned by _generalise_groups()!
         '''
         raise NotImplementedError()
 
@@ -257,9 +300,22 @@ class GeneralisedSchema:
         '''
         return df
 
+    def _generalise_groups(self, df, labels):
+        '''
+        Overwrite this method in subclasses, preferably with grouped operations such as
+        `df.groupby(labels).min()`.
+        It receives a pandas data frame containing the rows of all partitions and an
+        integer array holding the partition of every row (see generalise()). It must return
+        a pandas data frame indexed by the partition numbers which holds the generalised
+        quasi-identifier values of each partition in the columns returned by quasi_identifier().
+        By default, _generalise_partition() is called for every partition.
+        '''
+        rows = [self._generalise_partition(group) for _, group in df.groupby(labels)]
+        return pd.DataFrame(rows, index=np.unique(labels), columns=self.quasi_identifier())
+
     def _generalise_partition(self, df):
         '''
-        Overwrite this method in subclasses.
+        Overwrite this method in subclasses which do not overwrite _generalise_groups().
         It receives a pandas data frame containing the rows from a single
         partition (see generalise()). It must return a list of cell values
         containing the generalised quasi-identifier values corresponding
@@ -267,32 +323,26 @@ class GeneralisedSchema:
         '''
         raise NotImplementedError()
 
-    def _generalise_quasi_identifiers(self, df, partitions):
-        data = []
-        columns = self.quasi_identifier()
-        for i, partition in enumerate(partitions):
-            row = self._generalise_partition(df.loc[partition])
-            row.append(i)
-            data.append(row)
-        columns.append('group_id')
-
-        return pd.DataFrame(data, columns=columns)
+    def _generalise_quasi_identifiers(self, df, labels, num_groups):
+        inside = labels >= 0
+        result = self._generalise_groups(df[inside], labels[inside])
+        result = result.reindex(range(num_groups))
+        result['group_id'] = range(num_groups)
+        return result.reset_index(drop=True)
 
-    def _count_unique_unaltered_values(self, df, partitions):
-        unaltered_data = []
+    def _count_unique_unaltered_values(self, df, labels, num_groups):
+        inside = labels >= 0
 
-        for i, partition in enumerate(partitions):
-            sensitive_counts = count_sensitive_values_in_partition(df, partition, self._unaltered)
+        if len(self._unaltered) == 0:
+            counts = np.bincount(labels[inside], minlength=num_groups)
+            return pd.DataFrame({'count': counts, 'group_id': range(num_groups)})
 
-            for j in range(len(sensitive_counts.index)):
-                row = []
-                for column in self._unaltered:
-                    row.append(sensitive_counts[column][j])
-                row.append(sensitive_counts['count'][j])
-                row.append(i)
-                unaltered_data.append(row)
-
-        result = pd.DataFrame(unaltered_data, columns=self._unaltered + ['count', 'group_id'])
+        # one groupby for all partitions, ordered by partition and then by value like
+        # a separate groupby per partition
+        unaltered = df.loc[inside, self._unaltered]
+        counts = unaltered.groupby([labels[inside]] + [unaltered[column] for column in self._unaltered], observed=True).size()
+        counts.index = counts.index.set_names(['group_id'] + self._unaltered)
+        result = counts.reset_index(name='count')[self._unaltered + ['count', 'group_id']]
 
         for col in self._unaltered:
             result[col] = result[col].astype(df.dtypes[col])
@@ -306,6 +356,45 @@ class GeneralisedSchema:
         '''
         return column in self._unaltered
 
+def partition_labels(df, partitions):
+    '''
+    Returns an integer array holding the number of the partition of every row of the
+    data frame (-1 for rows which are not part of any partition) and the number of partitions.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The partitioned data frame. Its index must be unique.
+    partitions : iterable of pandas indices
+        Each index defines a subset of rows from the data frame. The subsets must not overlap.
+    '''
+    partitions = list(partitions)
+    labels = np.full(len(df.index), -1, dtype=np.intp)
+    positions, partition_of = partition_positions(df, partitions)
+    labels[positions] = partition_of
+    return labels, len(partitions)
+
+def partition_positions(df, partitions):
+    '''
+    Returns the positions of the rows of the given partitions within the data frame and
+    an integer array of the same length holding the number of each row's partition.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The partitioned data frame. Its index must be unique.
+    partitions : list of pandas indices
+        Each index defines a subset of rows from the data frame. The subsets must not overlap.
+    '''
+    partitions = [np.asarray(partition) for partition in partitions]
+    if len(partitions) == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    positions = df.index.get_indexer(np.concatenate(partitions))
+    if (positions < 0).any():
+        raise KeyError("The partitions contain labels which are not in the data frame.")
+    return positions, np.repeat(np.arange(len(partitions)), [len(partition) for partition in partitions])
+
 def count_sensitive_values_in_partition(df, partition, unaltered_columns):
     if len(unaltered_columns) == 0:
         return pd.DataFrame([{'count': len(partition)}])
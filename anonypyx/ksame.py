@@ -1,11 +1,42 @@
 import numpy as np
-import pandas as pd
 import random
-from sklearn.decomposition import PCA
+from sklearn.decomposition import PCA, IncrementalPCA
 from scipy.spatial.distance import cdist
+from scipy import sparse
 
 import anonypyx.algorithms as microaggregation
 
+def _clustering_algorithm(clustering_implementation):
+    if type(clustering_implementation) is not str:
+        raise TypeError("clustering_implementation must be sa string")
+    if clustering_implementation == 'Random Choice':
+        return microaggregation.RandomChoiceAggregation
+    elif clustering_implementation == 'MDAV-Generic':
+        return microaggregation.MDAVGeneric
+    elif clustering_implementation == 'MDAV-Blocked':
+        return microaggregation.BlockedMicroaggregation
+    else: 
+        raise ValueError(f"unknown clustering_implementation {clustering_implementation}")
+
+def cluster_labels(clusters, size):
+    '''
+    Returns an integer array holding the number of the cluster of each of the size records.
+    The clusters hold row positions.
+    '''
+    labels = np.empty(size, dtype=np.intp)
+    labels[np.concatenate(clusters)] = np.repeat(np.arange(len(clusters)), [len(cluster) for cluster in clusters])
+    return labels
+
+def cluster_means(labels, values):
+    '''
+    Returns the mean of the rows of values within each cluster as a 2-D array (cluster, column).
+    The sums are computed as one product with a sparse cluster membership matrix.
+    '''
+    # a membership matrix of the values' dtype avoids upcasting them, e.g. from float32
+    weights = np.ones(len(labels), dtype=values.dtype if np.issubdtype(values.dtype, np.floating) else np.float64)
+    membership = sparse.csr_matrix((weights, (labels, np.arange(len(labels)))))
+    return (membership @ values) / np.bincount(labels)[:, np.newaxis]
+
 class kSame:
     '''
     Implementation of the k-Same family of image anonymization
@@ -42,8 +73,18 @@ class kSame:
             variant : string
                 k-Same algorithm to be used. Can be either "pixel" or "eigen". (default: "eigen")
             clustering_implementation : string
-                Microaggregation algorithm to use. Must be either "MDAV-Generic" or 
-                "Random Choice". (default: "Random Choice") 
+                Microaggregation algorithm to use. Must be either "MDAV-Generic", "MDAV-Blocked"
+                or "Random Choice". "MDAV-Blocked" runs MDAV-Generic on blocks of at most 5000
+                images (see `algorithms.BlockedMicroaggregation`). (default: "Random Choice") 
+            n_components : int or float
+                Number of principal components (eigenfaces) to retain. A float between 0 and 1 retains
+                the fewest components which explain at least this fraction of the variance. The same
+                components are used for clustering and for the "eigen" variant. None retains
+                min(number of images, pixels) components. (default: None)
+            pca_solver : string
+                SVD solver of the PCA. Can be either "auto", "full" or "randomized". "randomized"
+                approximates the leading components and is much faster when few components are retained
+                from many images. (default: "auto")
 
         Raises
         ------
@@ -55,6 +96,8 @@ class kSame:
         k = kwargs.get("k", 1)
         clustering_implementation = kwargs.get("clustering_implementation", "Random Choice")
         variant = kwargs.get("variant", "eigen")
+        n_components = kwargs.get("n_components", None)
+        pca_solver = kwargs.get("pca_solver", "auto")
 
         if type(k) is not int:
             raise TypeError("k must be an integer.")
@@ -84,14 +127,26 @@ class kSame:
             raise ValueError(f"unknown variant {variant}")
         self.variant = variant
 
-        if type(clustering_implementation) is not str:
-            raise TypeError("clustering_implementation must be sa string")
-        if clustering_implementation == 'Random Choice':
-            self.clustering_implementation = microaggregation.RandomChoiceAggregation
-        elif clustering_implementation == 'MDAV-Generic':
-            self.clustering_implementation = microaggregation.MDAVGeneric
-        else: 
-            raise ValueError(f"unknown clustering_implementation {clustering_implementation}")
+        self.clustering_implementation = _clustering_algorithm(clustering_implementation)
+
+        max_components = min(len(input_images), height * width)
+        if n_components is None:
+            n_components = max_components
+        elif type(n_components) is int:
+            if n_components < 1 or n_components > max_components:
+                raise ValueError("n_components must be between 1 and the smaller of the number of images and pixels.")
+        elif type(n_components) is float:
+            if n_components <= 0 or n_components >= 1:
+                raise ValueError("n_components must be between 0 and 1 when it is a float.")
+        else:
+            raise TypeError("n_components must be an integer or a float.")
+        self.n_components = n_components
+
+        if type(pca_solver) is not str:
+            raise TypeError("pca_solver must be a string")
+        if pca_solver not in ("auto", "full", "randomized"):
+            raise ValueError(f"unknown pca_solver {pca_solver}")
+        self.pca_solver = pca_solver
 
     def anonymize(self):
         '''
@@ -99,43 +154,210 @@ class kSame:
 
         Returns
         -------
-            List of anonymized records.
+            A 3-D array in format (cluster, height, width) holding the anonymized image of every
+            cluster and a 1-D integer array holding the cluster of every input image.
         '''
         self.__setup()
 
-        clustering_algorithm = self.clustering_implementation(self.k, self.eigenface_df.columns)
-        clusters = clustering_algorithm.partition(self.eigenface_df)
-
-        anonymized = []
+        clustering_algorithm = self.clustering_implementation(self.k, range(self.eigenfaces.shape[1]))
+        clusters = clustering_algorithm.partition(self.eigenfaces)
+        labels = cluster_labels(clusters, len(self.input_images))
 
         if (self.variant == 'pixel'):
-            anonymized = [self.anonymize_kSamePixel(cluster) for cluster in clusters]
+            anonymized = cluster_means(labels, self.flattened_images)
         elif (self.variant == 'eigen'):
-            anonymized = [self.anonymize_kSameEigen(cluster) for cluster in clusters]
+            # one inverse transform for all clusters
+            anonymized = self.pca.inverse_transform(cluster_means(labels, self.eigenfaces))
         else:
             raise ValueError(f"Unknown algorithm variant '{self.variant}' selected.")
 
-        mapping = {image_num: cluster_num for cluster_num in range(len(clusters)) for image_num in clusters[cluster_num]}
-
-        return anonymized, mapping
+        return np.ascontiguousarray(anonymized.reshape((len(clusters),) + self.original_shape)), labels
 
     def __setup(self):
         pixels = self.original_shape[0] * self.original_shape[1]
-        flattened_images = np.reshape(self.input_images, (self.input_images.shape[0], pixels))
+        # the PCA and the clustering keep float32 throughout
+        self.flattened_images = np.reshape(self.input_images, (self.input_images.shape[0], pixels)).astype(np.float32)
+
+        self.pca = self.__fit_pca(self.flattened_images)
+        self.eigenfaces = self.pca.transform(self.flattened_images)
 
-        self.pca = PCA(n_components = min(self.input_images.shape[0], pixels))
-        self.pca.fit(flattened_images)
-        eigenfaces = self.pca.transform(flattened_images)
+    def __fit_pca(self, flattened_images):
+        if type(self.n_components) is int or self.pca_solver != "randomized":
+            return PCA(n_components=self.n_components, svd_solver=self.pca_solver).fit(flattened_images)
 
-        self.image_df = pd.DataFrame(data = flattened_images)
-        self.eigenface_df = pd.DataFrame(data = eigenfaces)
+        # the randomized solver needs a number of components: double it until the leading
+        # components explain the requested fraction of the variance
+        max_components = min(flattened_images.shape)
+        count = min(16, max_components)
+        while True:
+            pca = PCA(n_components=count, svd_solver="randomized").fit(flattened_images)
+            explained = np.cumsum(pca.explained_variance_ratio_)
+            if explained[-1] >= self.n_components or count == max_components:
+                break
+            count = min(2 * count, max_components)
+
+        needed = min(int(np.searchsorted(explained, self.n_components)) + 1, count)
+        if needed < count:
+            pca = PCA(n_components=needed, svd_solver="randomized").fit(flattened_images)
+        return pca
 
     def anonymize_kSamePixel(self, cluster):
-        result = self.image_df.loc[cluster].mean()
-        return result.to_numpy().reshape(self.original_shape)
+        result = self.flattened_images[cluster].mean(axis=0)
+        return result.reshape(self.original_shape)
 
     def anonymize_kSameEigen(self, cluster):
-        result = self.eigenface_df.loc[cluster].mean()
-        result = self.pca.inverse_transform([result.to_numpy()])[0]
+        result = self.eigenfaces[cluster].mean(axis=0)
+        result = self.pca.inverse_transform([result])[0]
         return result.reshape(self.original_shape)
 
+
+class StreamingkSame:
+    '''
+    k-Same-Eigen for image stacks which do not fit into memory, e.g. an np.memmap. The
+    images are read in batches: an IncrementalPCA is fitted batch by batch, every batch
+    is projected into a float32 eigen-space array, the eigen-space array is clustered and
+    the anonymised images are written batch by batch to an output array (e.g. another
+    np.memmap). Peak memory is bounded by the batch size plus the eigen-space array of
+    n_components values per image.
+
+    Only the "eigen" variant is supported: the "pixel" variant needs the pixel sums of
+    every cluster, which grow with the corpus.
+    '''
+    def __init__(self, width, height, **kwargs):
+        '''
+        Creates a new streaming image anonymizer. Checks whether the parameter values
+        are valid.
+
+        Parameters
+        ----------
+
+            width : int
+                Width of the input images in pixels.
+            height : int
+                Height of the input images in pixels.
+
+        Keyword Parameters
+        ------------------
+            k : int
+                Parameter k of k-anonymity. (default: 1)
+            clustering_implementation : string
+                Microaggregation algorithm to use (see `kSame`). (default: "MDAV-Blocked")
+            n_components : int
+                Number of eigenfaces to retain. Must not exceed batch_size. (default: 50)
+            batch_size : int
+                Number of images read and written at once. (default: 1000)
+
+        Raises
+        ------
+            TypeError 
+                When a parameter has the wrong type.
+            ValueError 
+                When a single parameter value or a combination of parameter values are invalid.
+        '''
+        k = kwargs.get("k", 1)
+        clustering_implementation = kwargs.get("clustering_implementation", "MDAV-Blocked")
+        n_components = kwargs.get("n_components", 50)
+        batch_size = kwargs.get("batch_size", 1000)
+
+        if type(k) is not int:
+            raise TypeError("k must be an integer.")
+        if k < 1:
+            raise ValueError("k must be positive.")
+        self.k = k
+
+        if type(width) is not int:
+            raise TypeError("width must be an integer.")
+        if type(height) is not int:
+            raise TypeError("height must be an integer.")
+        self.original_shape = (height, width)
+
+        self.clustering_implementation = _clustering_algorithm(clustering_implementation)
+
+        if type(n_components) is not int:
+            raise TypeError("n_components must be an integer.")
+        if type(batch_size) is not int:
+            raise TypeError("batch_size must be an integer.")
+        if n_components < 1 or n_components > height * width:
+            raise ValueError("n_components must be between 1 and the number of pixels.")
+        if batch_size < n_components:
+            raise ValueError("batch_size must be at least n_components.")
+        self.n_components = n_components
+        self.batch_size = batch_size
+        self.pca = None
+
+    def anonymize(self, images, output=None):
+        '''
+        Anonymizes the images.
+
+        Parameters
+        ----------
+
+            images : numpy.array or callable
+                Either a 3-D array in format (image, height, width), e.g. an np.memmap, which is
+                read in slices of batch_size images, or a callable returning a new iterator over
+                batches of images (3-D arrays) every time it is called. The images are read twice.
+            output : numpy.array
+                3-D array in format (image, height, width), e.g. an np.memmap, which receives the
+                anonymized images. None allocates an array in memory. (default: None)
+
+        Returns
+        -------
+            The output array and a 1-D integer array holding the cluster of every image.
+        '''
+        self.pca = IncrementalPCA(n_components=self.n_components)
+        for batch in self.__fitting_batches(images):
+            self.pca.partial_fit(batch)
+
+        eigenfaces = np.concatenate(
+            [self.pca.transform(batch).astype(np.float32) for batch in self.__batches(images)]
+        )
+        if len(eigenfaces) < self.k:
+            raise ValueError("k must not exceed the number of images.")
+
+        labels = self.__cluster(eigenfaces)
+        means = cluster_means(labels, eigenfaces)
+
+        if output is None:
+            output = np.empty((len(eigenfaces),) + self.original_shape)
+        if output.shape != (len(eigenfaces),) + self.original_shape:
+            raise ValueError("output must have the format (image, height, width) and hold every image.")
+
+        for start in range(0, len(labels), self.batch_size):
+            batch_labels = labels[start:start + self.batch_size]
+            # every cluster of the batch is reconstructed once
+            clusters, inverse = np.unique(batch_labels, return_inverse=True)
+            faces = self.pca.inverse_transform(means[clusters])[inverse]
+            output[start:start + len(batch_labels)] = faces.reshape((len(batch_labels),) + self.original_shape)
+
+        return output, labels
+
+    def __cluster(self, eigenfaces):
+        clustering_algorithm = self.clustering_implementation(self.k, range(eigenfaces.shape[1]))
+        return cluster_labels(clustering_algorithm.partition(eigenfaces), len(eigenfaces))
+
+    def __batches(self, images):
+        pixels = self.original_shape[0] * self.original_shape[1]
+        if callable(images):
+            batches = images()
+        else:
+            batches = (images[start:start + self.batch_size] for start in range(0, len(images), self.batch_size))
+
+        for batch in batches:
+            batch = np.asarray(batch)
+            if batch.shape[1:] != self.original_shape:
+                raise ValueError("Input images are malformed. Ensure that every image has the specified width and height.")
+            yield batch.reshape(len(batch), pixels).astype(np.float32)
+
+    def __fitting_batches(self, images):
+        # partial_fit needs at least n_components images per batch, a smaller remainder
+        # is only projected
+        pending = []
+        fitted = False
+        for batch in self.__batches(images):
+            pending.append(batch)
+            if sum(len(b) for b in pending) >= self.n_components:
+                yield np.concatenate(pending)
+                pending = []
+                fitted = True
+        if not fitted:
+            raise ValueError("n_components must not exceed the number of images.")
@@ -1,21 +1,205 @@
+import numpy as np
+import pandas as pd
+
+class PartitionSummary:
+    '''
+    Sufficient statistics of a partition: the number of records plus, for every
+    sensitive column, a histogram counting how often each value of the column's
+    domain occurs. Missing values are not counted in the histograms.
+
+    Privacy models may implement `is_enforcable_summary(summary)` in addition to
+    `is_enforcable(df)` and expose the attribute `sensitive_column` (None if they
+    do not depend on a sensitive column). Partitioning algorithms then evaluate
+    them on summaries instead of data frame slices.
+    '''
+    @classmethod
+    def from_frame(cls, df, domains):
+        '''
+        Computes the summary of a data frame.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The rows of the partition.
+        domains : dict mapping str to pandas.Index
+            Maps the sensitive columns to their domains (see `sensitive_domain()`).
+        '''
+        histograms = {
+            column: histogram(encode_sensitive(df[column], domain), len(domain))
+            for column, domain in domains.items()
+        }
+        return PartitionSummary(len(df.index), histograms, domains)
+
+    def __init__(self, count, histograms=None, domains=None):
+        '''
+        Constructor.
+
+        Parameters
+        ----------
+        count : int
+            The number of records in the partition.
+        histograms : dict mapping str to numpy.ndarray
+            Maps the sensitive columns to the value counts within the partition.
+            The i-th entry counts the occurrences of the i-th value of the column's domain.
+        domains : dict mapping str to pandas.Index
+            Maps the sensitive columns to their domains.
+        '''
+        self.count = count
+        self.histograms = histograms if histograms is not None else {}
+        self.domains = domains if domains is not None else {}
+
+    def __add__(self, other):
+        '''
+        Returns the summary of the union of two disjoint partitions.
+        '''
+        histograms = {column: counts + other.histograms[column] for column, counts in self.histograms.items()}
+        return PartitionSummary(self.count + other.count, histograms, self.domains)
+
+    def __sub__(self, other):
+        '''
+        Returns the summary of the records which are part of this partition but not
+        of the other one. The other partition must be a subset of this one.
+        '''
+        histograms = {column: counts - other.histograms[column] for column, counts in self.histograms.items()}
+        return PartitionSummary(self.count - other.count, histograms, self.domains)
+
+def sensitive_domain(series):
+    '''
+    Returns the domain of a sensitive column as a pandas.Index. For categorical columns,
+    these are the categories. Otherwise, it is the sorted set of non-missing values.
+    '''
+    if series.dtype.name == "category":
+        return series.cat.categories
+    return pd.Index(series.dropna().unique()).sort_values()
+
+def encode_sensitive(series, domain):
+    '''
+    Returns the position of each value of the series within the domain.
+    Missing values and values outside of the domain are encoded as -1.
+    '''
+    return pd.Categorical(series, categories=domain).codes
+
+def histogram(codes, size):
+    '''
+    Counts the occurrences of the codes returned by `encode_sensitive()`.
+    '''
+    return np.bincount(codes + 1, minlength=size + 1)[1:]
+
 class kAnonymity:
-    def __init__(self, k): 
+    sensitive_column = None
+
+    def __init__(self, k):
         self.__k = k
 
     def is_enforcable(self, df):
         return len(df.index) >= self.__k
 
+    def is_enforcable_summary(self, summary):
+        return summary.count >= self.__k
+
 class DistinctLDiversity:
     def __init__(self, l, sensitive_column):
         self.__l = l
         self.__sensitive_column = sensitive_column
 
+    @property
+    def sensitive_column(self):
+        return self.__sensitive_column
+
     def is_enforcable(self, df):
         if self.__sensitive_column is None:
             return False
         return self.__l <= len(df[self.__sensitive_column].unique())
 
+    def is_enforcable_summary(self, summary):
+        if self.__sensitive_column is None:
+            return False
+        counts = summary.histograms[self.__sensitive_column]
+        # like unique() in is_enforcable(), missing values count as one more distinct value
+        missing = summary.count - counts.sum()
+        return self.__l <= np.count_nonzero(counts) + (missing > 0)
+
+def sensitive_counts(df, sensitive_column):
+    '''
+    Returns how often each value of the sensitive column occurs in the data frame as a
+    numpy.ndarray. Values which do not occur and missing values are not counted.
+    '''
+    return df[sensitive_column].value_counts(sort=False).to_numpy()
+
+class EntropyLDiversity:
+    '''
+    Entropy l-diversity: the entropy of the sensitive values of every equivalence class
+    must be at least log(l).
+    '''
+    def __init__(self, l, sensitive_column):
+        self.__l = l
+        self.__sensitive_column = sensitive_column
+
+    @property
+    def sensitive_column(self):
+        return self.__sensitive_column
+
+    def is_enforcable(self, df):
+        if self.__sensitive_column is None:
+            return False
+        return self.__is_enforcable_counts(sensitive_counts(df, self.__sensitive_column))
+
+    def is_enforcable_summary(self, summary):
+        if self.__sensitive_column is None:
+            return False
+        return self.__is_enforcable_counts(summary.histograms[self.__sensitive_column])
+
+    def __is_enforcable_counts(self, counts):
+        counts = counts[counts > 0]
+        if len(counts) < self.__l:
+            return False
+        p = counts / counts.sum()
+        entropy = -np.dot(p, np.log(p))
+        # tolerates rounding errors for exactly uniform distributions
+        return entropy >= np.log(self.__l) - 1e-9
+
+class RecursiveCLDiversity:
+    '''
+    Recursive (c,l)-diversity: let r_1 >= r_2 >= ... >= r_m be the counts of the sensitive
+    values of an equivalence class. The class satisfies the model if r_1 < c * (r_l + ... + r_m).
+    '''
+    def __init__(self, c, l, sensitive_column):
+        self.__c = c
+        self.__l = l
+        self.__sensitive_column = sensitive_column
+
+    @property
+    def sensitive_column(self):
+        return self.__sensitive_column
+
+    def is_enforcable(self, df):
+        if self.__sensitive_column is None:
+            return False
+        return self.__is_enforcable_counts(sensitive_counts(df, self.__sensitive_column))
+
+    def is_enforcable_summary(self, summary):
+        if self.__sensitive_column is None:
+            return False
+        return self.__is_enforcable_counts(summary.histograms[self.__sensitive_column])
+
+    def __is_enforcable_counts(self, counts):
+        counts = counts[counts > 0]
+        if len(counts) < self.__l:
+            return False
+        # only the l - 1 largest counts need to be ordered
+        split = len(counts) - self.__l + 1
+        top = np.partition(counts, split)[split:] if self.__l > 1 else counts[:0]
+        tail = counts.sum() - top.sum()
+        return counts.max() < self.__c * tail
+
 def earth_movers_distance_categorical(distribution1, distribution2):
+    '''
+    Earth mover's distance with equal ground distances between all values. The distributions
+    are either dicts mapping values to frequencies or numpy arrays aligned to the same domain.
+    '''
+    if not isinstance(distribution1, dict):
+        return 0.5 * np.abs(distribution1 - distribution2).sum()
+
     diff_sum = 0.0
 
     for value, f1 in distribution1.items():
@@ -24,7 +208,30 @@ def earth_movers_distance_categorical(distribution1, distribution2):
 
     return diff_sum * 0.5
 
+def earth_movers_distance_ordered(distribution1, distribution2):
+    '''
+    Earth mover's distance for ordered values: the ground distance between the i-th and the j-th
+    smallest of m values is |i - j| / (m - 1). Equals the L1 norm of the difference between the
+    cumulative distributions divided by m - 1. The distributions are either dicts mapping values
+    to frequencies or numpy arrays aligned to the same sorted domain.
+    '''
+    if isinstance(distribution1, dict):
+        values = sorted(set(distribution1) | set(distribution2))
+        distribution1 = np.array([distribution1.get(value, 0.0) for value in values])
+        distribution2 = np.array([distribution2.get(value, 0.0) for value in values])
+
+    if len(distribution1) < 2:
+        return 0.0
+    return np.abs(np.cumsum(distribution1 - distribution2)).sum() / (len(distribution1) - 1)
+
 def max_distance_metric(distribution1, distribution2):
+    '''
+    Largest difference between the frequencies of a value. The distributions are either dicts
+    mapping values to frequencies or numpy arrays aligned to the same domain.
+    '''
+    if not isinstance(distribution1, dict):
+        return np.abs(distribution1 - distribution2).max(initial=0.0)
+
     max_diff = 0
 
     for value, f1 in distribution1.items():
@@ -33,14 +240,48 @@ def max_distance_metric(distribution1, distribution2):
 
     return max_diff
 
+def distance(distance_metric, frequencies1, frequencies2, domain):
+    '''
+    Applies a distance metric of t-closeness to two distributions given as numpy arrays of
+    frequencies aligned to the domain of the sensitive column (see `sensitive_domain()`).
+    The metrics of this module receive the arrays. Any other callable receives dicts which
+    map every value of the domain to its frequency.
+    '''
+    if distance_metric in (max_distance_metric, earth_movers_distance_categorical, earth_movers_distance_ordered):
+        return distance_metric(frequencies1, frequencies2)
+    return distance_metric(dict(zip(domain, frequencies1)), dict(zip(domain, frequencies2)))
+
 class tCloseness:
     def __init__(self, t, df, sensitive_column, distance_metric):
+        '''
+        Constructor.
+
+        Parameters
+        ----------
+        t : float
+            The maximum distance between the distribution of the sensitive values within an
+            equivalence class and their distribution in the whole data set. Both distributions
+            cover the whole domain, values missing from the class have a frequency of 0.
+        df : pandas.DataFrame
+            The whole data set.
+        sensitive_column : str
+            The name of the sensitive column.
+        distance_metric : callable
+            Computes the distance between two distributions (see `distance()`), e.g.
+            `max_distance_metric`, `earth_movers_distance_categorical` or `earth_movers_distance_ordered`.
+        '''
         self.__t = t
         self.__sensitive_column = sensitive_column
         if self.__sensitive_column is not None:
-            self.__global_frequencies = get_frequency(df, sensitive_column)
+            self.__domain = sensitive_domain(df[sensitive_column])
+            counts = histogram(encode_sensitive(df[sensitive_column], self.__domain), len(self.__domain))
+            self.__global_frequencies = counts / float(len(df.index))
         self.__metric = distance_metric
 
+    @property
+    def sensitive_column(self):
+        return self.__sensitive_column
+
     def is_enforcable(self, df):
         if self.__sensitive_column is None:
             return False
@@ -49,9 +290,28 @@ class tCloseness:
         if total_count == 0:
             return False
 
-        local_frequencies = get_frequency(df, self.__sensitive_column)
+        codes = encode_sensitive(df[self.__sensitive_column], self.__domain)
+        local_frequencies = histogram(codes, len(self.__domain)) / total_count
+
+        return distance(self.__metric, local_frequencies, self.__global_frequencies, self.__domain) <= self.__t
+
+    def is_enforcable_summary(self, summary):
+        if self.__sensitive_column is None:
+            return False
+
+        if summary.count == 0:
+            return False
+
+        domain = summary.domains[self.__sensitive_column]
+        counts = summary.histograms[self.__sensitive_column]
+        if domain is not self.__domain and not domain.equals(self.__domain):
+            # align the histogram to the domain of the global distribution
+            positions = self.__domain.get_indexer(domain)
+            known = positions >= 0
+            counts = np.bincount(positions[known], weights=counts[known], minlength=len(self.__domain))
+        local_frequencies = counts / float(summary.count)
 
-        return self.__metric(local_frequencies, self.__global_frequencies) <= self.__t
+        return distance(self.__metric, local_frequencies, self.__global_frequencies, self.__domain) <= self.__t
 
 def get_frequency(df, sensitive_column):
     global_freqs = {}
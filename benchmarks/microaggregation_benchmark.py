@@ -0,0 +1,70 @@
+'''
+Compares the running times of the microaggregation algorithms on synthetic data.
+
+Usage (from the repository root): python -m benchmarks.microaggregation_benchmark [number of records ...]
+'''
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from anonypyx.algorithms import MDAVGeneric, FMDAV, RandomChoiceAggregation, BlockedMicroaggregation
+
+def synthetic_data(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(rng.normal(size=(n, 4)), columns=["num1", "num2", "num3", "num4"])
+    df["cat1"] = pd.Categorical(rng.choice(["a", "b", "c", "d"], n))
+    return df
+
+def measure(algorithm, df):
+    start = time.perf_counter()
+    clusters = algorithm.partition(df)
+    return time.perf_counter() - start, len(clusters)
+
+def information_loss(df, columns, clusters):
+    '''
+    Within-cluster sum of squares of the standardised columns divided by their total sum of squares.
+    '''
+    values = df[columns].to_numpy(dtype=np.float64)
+    values = (values - values.mean(axis=0)) / values.std(axis=0)
+    positions = [df.index.get_indexer(cluster) for cluster in clusters]
+    within = sum(((values[p] - values[p].mean(axis=0)) ** 2).sum() for p in positions)
+    return within / (values ** 2).sum()
+
+def main(sizes):
+    k = 3
+    print(f"{'records':>8} {'columns':>12} {'MDAVGeneric':>12} {'FMDAV':>8} {'speedup':>8}")
+    for n in sizes:
+        df = synthetic_data(n)
+        for name, columns in (("continuous", ["num1", "num2", "num3", "num4"]), ("mixed", list(df.columns))):
+            mdav_time, _ = measure(MDAVGeneric(k, columns), df)
+            fmdav_time, _ = measure(FMDAV(k, columns), df)
+            print(f"{n:>8} {name:>12} {mdav_time:>11.2f}s {fmdav_time:>7.2f}s {mdav_time / fmdav_time:>7.1f}x")
+
+    continuous = ["num1", "num2", "num3", "num4"]
+    print()
+    print(f"{'records':>8} {'algorithm':>24} {'scan':>8} {'kd-tree':>8} {'speedup':>8}")
+    for n in sizes:
+        df = synthetic_data(n)
+        for algorithm in (MDAVGeneric, FMDAV, RandomChoiceAggregation):
+            scan_time, _ = measure(algorithm(k, continuous), df)
+            tree_time, _ = measure(algorithm(k, continuous, neighbours="kd-tree"), df)
+            print(f"{n:>8} {algorithm.__name__:>24} {scan_time:>7.2f}s {tree_time:>7.2f}s {scan_time / tree_time:>7.1f}x")
+
+    print()
+    print(f"{'records':>8} {'algorithm':>24} {'time':>8} {'SSE/SST':>8}")
+    for n in sizes:
+        df = synthetic_data(n)
+        for name, algorithm in (
+            ("MDAVGeneric", MDAVGeneric(k, continuous)),
+            ("blocked (1000)", BlockedMicroaggregation(k, continuous, block_size=1000)),
+            ("blocked (5000)", BlockedMicroaggregation(k, continuous, block_size=5000)),
+        ):
+            start = time.perf_counter()
+            clusters = algorithm.partition(df)
+            elapsed = time.perf_counter() - start
+            print(f"{n:>8} {name:>24} {elapsed:>7.2f}s {information_loss(df, continuous, clusters):>8.4f}")
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 5000, 10000])
@@ -44,3 +44,43 @@ def test_t_closeness(prepared_df):
 
     dfn = pd.DataFrame(rows)
     print(dfn)
+
+
+def test_n_jobs_must_be_positive(prepared_df):
+    with pytest.raises(ValueError):
+        anonypyx.Anonymiser(prepared_df, k=2, n_jobs=0, feature_columns=["col1", "col2", "col3"])
+
+@pytest.mark.parametrize("definition, options", [("entropy", {}), ("recursive", {"c": 3.0})])
+def test_l_diversity_definitions(prepared_df, definition, options):
+    a = anonypyx.Anonymiser(prepared_df, k=2, l=2, diversity_definition=definition, feature_columns=["col1", "col2", "col3"], sensitive_column="col4", **options)
+    rows = a.anonymise()
+
+    dfn = pd.DataFrame(rows)
+    assert dfn["count"].sum() == len(prepared_df.index)
+
+def test_recursive_diversity_requires_c(prepared_df):
+    with pytest.raises(ValueError):
+        anonypyx.Anonymiser(prepared_df, k=2, l=2, diversity_definition="recursive", feature_columns=["col1", "col2", "col3"], sensitive_column="col4")
+
+def test_t_closeness_numerical_earth_movers_distance(prepared_df):
+    a = anonypyx.Anonymiser(prepared_df, k=2, t=0.3, closeness_metric="earth mover's distance", feature_columns=["col1", "col2", "col3"], sensitive_column="col5")
+    rows = a.anonymise()
+
+    dfn = pd.DataFrame(rows)
+    assert dfn["count"].sum() == len(prepared_df.index)
+
+def test_f_mdav(prepared_df):
+    a = anonypyx.Anonymiser(prepared_df, k=3, algorithm="F-MDAV", feature_columns=["col1", "col5"])
+    rows = a.anonymise()
+
+    dfn = pd.DataFrame(rows)
+    assert dfn["count"].sum() == len(prepared_df.index)
+    assert all(len(cluster) >= 3 for cluster in a.algorithm.partition(prepared_df))
+
+def test_blocked_mdav(prepared_df):
+    a = anonypyx.Anonymiser(prepared_df, k=3, algorithm="MDAV-blocked", feature_columns=["col1", "col5"])
+    rows = a.anonymise()
+
+    dfn = pd.DataFrame(rows)
+    assert dfn["count"].sum() == len(prepared_df.index)
+    assert all(len(cluster) >= 3 for cluster in a.algorithm.partition(prepared_df))
@@ -0,0 +1,68 @@
+import anonypyx
+from anonypyx import feasibility, models
+
+import numpy as np
+import pandas as pd
+import pytest
+
+@pytest.fixture
+def df():
+    # sensitive counts: a: 4, b: 3, c: 2, d: 1
+    values = ["a"] * 4 + ["b"] * 3 + ["c"] * 2 + ["d"]
+    return pd.DataFrame({"qi": range(10), "s": pd.Categorical(values)})
+
+def test_max_l_distinct(df):
+    report = feasibility.analyse(df, k=2, sensitive_column="s", l=2)
+    assert report.max_k == 10
+    assert report.max_l == 4
+
+def test_max_l_distinct_counts_missing_values_like_model():
+    df = pd.DataFrame({"a": range(1, 7), "s": ["x", "y", None, "x", "y", None]})
+    report = feasibility.analyse(df, k=2, sensitive_column="s", l=3)
+
+    assert report.max_l == 3
+    assert models.DistinctLDiversity(3, "s").is_enforcable(df)
+    assert not models.DistinctLDiversity(4, "s").is_enforcable(df)
+    anonypyx.Anonymiser(df, k=2, l=3, feature_columns=["a"], sensitive_column="s")
+
+def test_max_l_entropy(df):
+    report = feasibility.analyse(df, sensitive_column="s", diversity_definition="entropy")
+    p = np.array([0.4, 0.3, 0.2, 0.1])
+    assert report.max_l == int(np.exp(-np.dot(p, np.log(p))))
+    assert models.EntropyLDiversity(report.max_l, "s").is_enforcable(df)
+    assert not models.EntropyLDiversity(report.max_l + 1, "s").is_enforcable(df)
+
+@pytest.mark.parametrize("c", [0.5, 1.0, 2.0, 5.0])
+def test_max_l_recursive(df, c):
+    report = feasibility.analyse(df, sensitive_column="s", diversity_definition="recursive", c=c)
+    for l in range(1, 6):
+        assert models.RecursiveCLDiversity(c, l, "s").is_enforcable(df) == (l <= report.max_l)
+
+def test_min_t_is_distance_of_closest_class(df):
+    report = feasibility.analyse(df, k=5, sensitive_column="s")
+    # the closest class of 5 records has the counts 2, 2, 1, 0 (or 2, 1, 1, 1)
+    assert report.min_t == pytest.approx(0.1)
+
+    exact = feasibility.analyse(df, k=10, sensitive_column="s")
+    assert exact.min_t == pytest.approx(0.0)
+
+def test_min_t_ordered_earth_movers_distance():
+    df = pd.DataFrame({"qi": range(6), "s": [1, 1, 2, 2, 3, 3]})
+    report = feasibility.analyse(df, k=2, sensitive_column="s", distance_metric=models.earth_movers_distance_ordered)
+
+    # the class {1, 3} is closer than any class holding a 2
+    assert report.min_t == pytest.approx(1 / 6)
+    assert models.tCloseness(0.17, df, "s", models.earth_movers_distance_ordered).is_enforcable(df.iloc[[0, 4]])
+
+def test_estimated_classes(df):
+    assert feasibility.analyse(df, k=2).estimated_classes == 5
+    # every 3-diverse class needs two records besides an "a"
+    assert feasibility.analyse(df, k=2, sensitive_column="s", l=3).estimated_classes == 3
+    assert feasibility.analyse(df, k=2, sensitive_column="s", t=0.0).estimated_classes == 1
+
+def test_anonymiser_rejects_infeasible_l(df):
+    with pytest.raises(ValueError):
+        anonypyx.Anonymiser(df, k=2, l=5, feature_columns=["qi"], sensitive_column="s")
+
+    a = anonypyx.Anonymiser(df, k=2, l=4, feature_columns=["qi"], sensitive_column="s")
+    assert a.feasibility.max_l == 4
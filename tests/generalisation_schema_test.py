@@ -56,3 +56,66 @@ def test_count_sensitive_values_with_multiple_columns():
     actual = count_sensitive_values_in_partition(df, [0, 1, 3, 4], ['S1', 'S2'])
 
     assert_data_set_equal(actual, expected)
+
+def test_partition_labels():
+    df = pd.DataFrame({'QI': [1, 2, 3, 4, 5]}, index=[10, 11, 12, 13, 14])
+
+    labels, num_groups = partition_labels(df, [pd.Index([13, 10]), [12], []])
+
+    assert num_groups == 3
+    assert list(labels) == [0, -1, 1, 0, -1]
+    with pytest.raises(KeyError):
+        partition_labels(df, [[10, 99]])
+
+def test_generalise_many_partitions_at_once():
+    from anonypyx.generalisation import MachineReadable, HumanReadable
+
+    df = pd.DataFrame({
+        'QI1': pd.Categorical(['a', 'b', 'a', 'c', 'b', 'a']),
+        'QI2': [5, 3, 5, 1, 2, 9],
+        'S': ['x', 'y', 'x', 'x', 'y', 'y'],
+    }, index=[6, 5, 4, 3, 2, 1])
+    # row 1 is not part of any partition
+    partitions = [pd.Index([2, 6, 5]), pd.Index([3, 4])]
+
+    machine = MachineReadable.create_for_data(df, ['QI1', 'QI2']).generalise(df, partitions)
+    assert machine['QI2_min'].tolist() == [2, 2, 1]
+    assert machine['QI2_max'].tolist() == [5, 5, 5]
+    assert machine['S'].tolist() == ['x', 'y', 'x']
+    assert machine['count'].tolist() == [1, 2, 2]
+    assert machine['QI1_c'].tolist() == [False, False, True]
+
+    human = HumanReadable.create_for_data(df, ['QI1', 'QI2']).generalise(df, partitions)
+    assert human['QI1'].tolist() == ['a,b', 'a,b', 'a,c']
+    assert human['QI2'].tolist() == ['2-5', '2-5', '1-5']
+
+def test_iter_generalise_yields_chunks_before_partitions_are_exhausted():
+    from anonypyx.generalisation import MachineReadable, HumanReadable
+
+    df = pd.DataFrame({
+        'QI1': pd.Categorical(['a', 'b', 'a', 'c', 'b', 'a', 'c']),
+        'QI2': [5, 3, 5, 1, 2, 9, 4],
+        'S': ['x', 'y', 'x', 'x', 'y', 'y', 'x'],
+    }, index=[6, 5, 4, 3, 2, 1, 0])
+    partitions = [pd.Index([2, 6, 5]), pd.Index([3, 4]), pd.Index([0, 1])]
+    consumed = []
+
+    def lazy_partitions():
+        for partition in partitions:
+            consumed.append(partition)
+            yield partition
+
+    for schema_type in (MachineReadable, HumanReadable):
+        schema = schema_type.create_for_data(df, ['QI1', 'QI2'])
+        consumed.clear()
+        chunks = schema.iter_generalise(df, lazy_partitions(), chunk_size=2)
+
+        first = next(chunks)
+        # the first chunk is generalised before the last partition was requested
+        assert len(consumed) == 2
+        rest = list(chunks)
+        assert len(consumed) == 3
+
+        expected = schema.generalise(df, partitions)
+        actual = pd.concat([first] + rest, ignore_index=True)
+        pd.testing.assert_frame_equal(actual, expected)
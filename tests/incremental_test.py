@@ -0,0 +1,110 @@
+from anonypyx import models
+from anonypyx.algorithms import IncrementalMondrian, Mondrian
+from tests.mondrian_test import random_df
+
+import numpy as np
+import pandas as pd
+import pytest
+
+feature_columns = ["age", "income", "sex", "zip"]
+
+def privacy_models():
+    return [models.kAnonymity(4), models.DistinctLDiversity(2, "diagnosis")]
+
+def assert_valid(incremental, df, expected_labels):
+    partitions = incremental.partitions()
+    labels = np.concatenate([partition.to_numpy() for partition in partitions])
+    assert sorted(labels) == sorted(expected_labels)
+
+    for partition in partitions:
+        assert all(model.is_enforcable(df.loc[partition]) for model in privacy_models())
+
+    routed = pd.Series(incremental.tree.route(df.loc[labels]), index=labels)
+    for i, partition in enumerate(partitions):
+        assert (routed[partition] == i).all()
+
+def test_fit_matches_mondrian():
+    df = random_df(600)
+    incremental = IncrementalMondrian(privacy_models(), feature_columns)
+
+    partitions = incremental.fit(df)
+
+    expected = Mondrian(privacy_models(), feature_columns).partition(df)
+    assert [list(p) for p in partitions] == [list(p) for p in expected]
+
+def test_insert_splits_grown_leaves():
+    df = random_df(2000, seed=3)
+    incremental = IncrementalMondrian(privacy_models(), feature_columns)
+    initial = incremental.fit(df.iloc[:500])
+
+    incremental.insert(df.iloc[500:1200])
+    incremental.insert(df.iloc[1200:])
+
+    assert len(incremental.partitions()) > 2 * len(initial)
+    assert_valid(incremental, df, df.index)
+
+def test_delete_merges_leaves_below_k():
+    df = random_df(1000, seed=4)
+    incremental = IncrementalMondrian(privacy_models(), feature_columns)
+    incremental.fit(df)
+
+    # empty a few classes entirely and thin out the rest
+    deleted = np.concatenate([p.to_numpy() for p in incremental.partitions()[:5]] + [df.index[::3].to_numpy()])
+    deleted = np.unique(deleted)
+    incremental.delete(deleted)
+
+    assert_valid(incremental, df, df.index.difference(deleted))
+
+def test_delete_everything_leaves_an_empty_class():
+    df = random_df(100, seed=5)
+    incremental = IncrementalMondrian(privacy_models(), feature_columns)
+    incremental.fit(df)
+
+    incremental.delete(df.index)
+
+    assert [len(p) for p in incremental.partitions()] == [0]
+    incremental.insert(random_df(50, seed=6).set_axis(range(50)))
+    assert sum(len(p) for p in incremental.partitions()) == 50
+
+def test_rejects_duplicate_and_unknown_labels():
+    df = random_df(200, seed=7)
+    incremental = IncrementalMondrian(privacy_models(), feature_columns)
+    incremental.fit(df.iloc[:150])
+
+    with pytest.raises(ValueError):
+        incremental.insert(df.iloc[100:])
+    with pytest.raises(KeyError):
+        incremental.delete(df.index[150:])
+
+def test_insert_and_delete_with_missing_quasi_identifiers():
+    df = random_df(1500)
+    df.loc[df.index[::7], "age"] = np.nan
+    incremental = IncrementalMondrian(privacy_models(), feature_columns)
+    incremental.fit(df.iloc[:600])
+    incremental.insert(df.iloc[600:])
+
+    deleted = df.index[::7][:200]
+    incremental.delete(deleted)
+
+    labels = np.concatenate([partition.to_numpy() for partition in incremental.partitions()])
+    assert len(np.intersect1d(labels, deleted)) == 0
+    for partition in incremental.partitions():
+        assert all(model.is_enforcable(df.loc[partition]) for model in privacy_models())
+
+def test_many_small_batches_with_data_frame_models():
+    class FrameKAnonymity:
+        def is_enforcable(self, df):
+            return len(df.index) >= 4
+
+    df = random_df(1200, seed=8)
+    incremental = IncrementalMondrian([FrameKAnonymity(), models.DistinctLDiversity(2, "diagnosis")], feature_columns)
+    incremental.fit(df.iloc[:300])
+
+    # every batch lands in a new chunk, the leaves mix records of many chunks
+    for start in range(300, 1200, 60):
+        incremental.insert(df.iloc[start:start + 60])
+    incremental.delete(df.index[::5])
+
+    assert_valid(incremental, df, df.index.difference(df.index[::5]))
+    with pytest.raises(ValueError):
+        incremental.insert(df.iloc[:1])
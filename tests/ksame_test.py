@@ -45,3 +45,102 @@ def test_kSamePixel(prepared_images):
     assert (expected1 == result[mapping[1]]).all()
     assert (expected2 == result[mapping[2]]).all()
     assert (expected2 == result[mapping[3]]).all()
+
+def test_kSamePixel_blocked_MDAV_matches_MDAV_on_a_single_block(prepared_images):
+    blocked = ksame.kSame(prepared_images, 3, 4, k=2, variant='pixel', clustering_implementation='MDAV-Blocked')
+    generic = ksame.kSame(prepared_images, 3, 4, k=2, variant='pixel', clustering_implementation='MDAV-Generic')
+
+    result, mapping = blocked.anonymize()
+    expected, expected_mapping = generic.anonymize()
+
+    assert sorted(mapping) == [0, 0, 1, 1]
+    for i in range(len(prepared_images)):
+        assert (result[mapping[i]] == expected[expected_mapping[i]]).all()
+
+def test_kSameEigen_truncated_pca(prepared_images):
+    anonymizer = ksame.kSame(prepared_images, 3, 4, k=2, variant='eigen', clustering_implementation='Random Choice', n_components=1)
+
+    result, mapping = anonymizer.anonymize()
+
+    assert anonymizer.pca.n_components_ == 1
+    assert anonymizer.eigenfaces.shape == (4, 1)
+    # the first component separates the two pairs of similar images
+    assert mapping[0] == mapping[1] and mapping[2] == mapping[3] and mapping[0] != mapping[2]
+    assert all(image.shape == (4, 3) for image in result)
+
+@pytest.mark.parametrize("solver", ["full", "randomized"])
+def test_kSame_explained_variance_target(solver):
+    rng = np.random.default_rng(0)
+    # three strong directions plus noise
+    images = (rng.normal(size=(60, 3)) @ rng.normal(size=(3, 100)) * 10 + rng.normal(size=(60, 100))).reshape(60, 10, 10)
+    anonymizer = ksame.kSame(images, 10, 10, k=3, n_components=0.9, pca_solver=solver)
+
+    anonymizer.anonymize()
+
+    ratios = np.cumsum(anonymizer.pca.explained_variance_ratio_)
+    assert ratios[-1] >= 0.9
+    assert anonymizer.pca.n_components_ == 1 or ratios[-2] < 0.9
+    assert anonymizer.pca.n_components_ <= 3
+
+def test_kSame_rejects_invalid_pca_options(prepared_images):
+    with pytest.raises(ValueError):
+        ksame.kSame(prepared_images, 3, 4, n_components=5)
+    with pytest.raises(ValueError):
+        ksame.kSame(prepared_images, 3, 4, n_components=1.5)
+    with pytest.raises(TypeError):
+        ksame.kSame(prepared_images, 3, 4, n_components="all")
+    with pytest.raises(ValueError):
+        ksame.kSame(prepared_images, 3, 4, pca_solver="arpack")
+
+def test_StreamingkSame_matches_cluster_means_in_eigen_space(tmp_path):
+    rng = np.random.default_rng(1)
+    images = (rng.normal(size=(45, 4)) @ rng.normal(size=(4, 30))).reshape(45, 5, 6)
+    stored = np.lib.format.open_memmap(tmp_path / "images.npy", mode="w+", dtype=np.float32, shape=images.shape)
+    stored[:] = images
+    output = np.lib.format.open_memmap(tmp_path / "output.npy", mode="w+", dtype=np.float32, shape=images.shape)
+
+    anonymizer = ksame.StreamingkSame(6, 5, k=3, n_components=4, batch_size=10)
+    result, labels = anonymizer.anonymize(stored, output)
+
+    assert result is output
+    assert np.bincount(labels).min() >= 3
+    # the images lie in a 4-dimensional subspace, so averaging eigenfaces averages images
+    for cluster in np.unique(labels):
+        expected = images[labels == cluster].mean(axis=0)
+        assert np.allclose(output[labels == cluster], expected, atol=1e-3)
+
+def test_StreamingkSame_reads_batch_iterators(prepared_images):
+    batches = lambda: iter([prepared_images[:3], prepared_images[3:]])
+    anonymizer = ksame.StreamingkSame(3, 4, k=2, n_components=2, batch_size=3, clustering_implementation='Random Choice')
+
+    result, labels = anonymizer.anonymize(batches)
+
+    assert result.shape == (4, 4, 3)
+    assert labels[0] == labels[1] and labels[2] == labels[3] and labels[0] != labels[2]
+
+def test_StreamingkSame_rejects_invalid_parameters(prepared_images):
+    with pytest.raises(ValueError):
+        ksame.StreamingkSame(3, 4, n_components=20, batch_size=50)
+    with pytest.raises(ValueError):
+        ksame.StreamingkSame(3, 4, n_components=10, batch_size=5)
+    with pytest.raises(ValueError):
+        ksame.StreamingkSame(3, 4, k=5, n_components=2).anonymize(prepared_images)
+
+def test_kSame_returns_contiguous_cluster_images(prepared_images):
+    anonymizer = ksame.kSame(prepared_images, 3, 4, k=2, variant='eigen', clustering_implementation='Random Choice')
+
+    result, labels = anonymizer.anonymize()
+
+    assert isinstance(result, np.ndarray) and result.flags["C_CONTIGUOUS"]
+    assert result.shape == (2, 4, 3)
+    assert labels.dtype.kind == "i" and labels.shape == (4,)
+    # without truncation, the eigenfaces reconstruct the mean images
+    for cluster in range(2):
+        assert np.allclose(result[cluster], prepared_images[labels == cluster].mean(axis=0), atol=1e-3)
+
+def test_cluster_means_and_labels():
+    labels = ksame.cluster_labels([np.array([3, 0]), np.array([1, 2, 4])], 5)
+    values = np.arange(10, dtype=float).reshape(5, 2)
+
+    assert list(labels) == [0, 1, 1, 0, 1]
+    assert ksame.cluster_means(labels, values).tolist() == [[3.0, 4.0], [14 / 3, 17 / 3]]
@@ -2,10 +2,15 @@ import pandas as pd
 import numpy as np
 from scipy.spatial.distance import pdist, squareform
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from anonypyx.algorithms.microaggregation import (
     MDAVGeneric,
     FMDAV,
     RandomChoiceAggregation,
+    RemainingRecords,
+    NearestNeighbourIndex,
+    mixed_distances,
+    BlockedMicroaggregation,
 )
 
 
@@ -271,3 +276,170 @@ def test_RandomChoice_does_not_alter_data():
     partitioner.partition(df)
 
     assert df.equals(expected)
+
+def test_MDAVGeneric_on_demand_distances_match_distance_matrix():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        "num1": rng.normal(size=200),
+        "num2": rng.uniform(size=200),
+    }, index=rng.permutation(200) + 50)
+    columns = ["num1", "num2"]
+
+    on_demand = MDAVGeneric(3, columns).partition(df)
+    precomputed = MDAVGeneric(3, columns, precompute_distances=True).partition(df)
+
+    assert [sorted(c) for c in on_demand] == [sorted(c) for c in precomputed]
+    assert all(len(c) >= 3 for c in on_demand)
+
+def test_FMDAV_matches_MDAVGeneric_on_random_data():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame(rng.normal(size=(300, 4)), columns=["a", "b", "c", "d"], index=rng.permutation(300))
+
+    mdav_actual = MDAVGeneric(3, ["a", "b", "c", "d"]).partition(df)
+    fmdav_actual = FMDAV(3, ["a", "b", "c", "d"]).partition(df)
+
+    assert sorted(sorted(c) for c in mdav_actual) == sorted(sorted(c) for c in fmdav_actual)
+
+def test_remaining_records_keep_original_order():
+    values = np.arange(12, dtype=float).reshape(6, 2)
+    remaining = RemainingRecords(values=values)
+
+    removed, kept = remaining.remove(np.array([4, 1]))
+
+    assert sorted(removed) == [1, 4]
+    assert list(kept) == [True, False, True, True, False, True]
+    assert list(remaining["positions"]) == [0, 2, 3, 5]
+    assert remaining["values"].tolist() == [[0, 1], [4, 5], [6, 7], [10, 11]]
+
+    remaining.remove(np.array([0]))
+    assert len(remaining) == 3
+    assert list(remaining["positions"]) == [2, 3, 5]
+
+def test_kd_tree_neighbours_match_scan():
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame(rng.normal(size=(500, 3)), columns=["a", "b", "c"], index=rng.permutation(500))
+
+    scan = MDAVGeneric(3, ["a", "b", "c"]).partition(df)
+    kd_tree = MDAVGeneric(3, ["a", "b", "c"], neighbours="kd-tree").partition(df)
+    assert sorted(sorted(c) for c in scan) == sorted(sorted(c) for c in kd_tree)
+
+    fmdav = FMDAV(3, ["a", "b", "c"], neighbours="kd-tree").partition(df)
+    assert sorted(sorted(c) for c in scan) == sorted(sorted(c) for c in fmdav)
+
+    random_choice = RandomChoiceAggregation(3, ["a", "b", "c"], neighbours="kd-tree").partition(df)
+    assert sorted(np.concatenate(random_choice)) == sorted(df.index)
+    assert all(len(c) >= 3 for c in random_choice)
+
+def test_kd_tree_neighbours_reject_categorical_columns():
+    df = pd.DataFrame({"a": [1.0, 2.0, 3.0], "b": pd.Categorical(["x", "y", "x"])})
+
+    with pytest.raises(ValueError):
+        MDAVGeneric(1, ["a", "b"], neighbours="kd-tree").partition(df)
+
+def test_nearest_neighbour_index_skips_removed_records():
+    index = NearestNeighbourIndex(np.arange(10, dtype=float).reshape(10, 1))
+
+    index.remove(np.array([4, 5]))
+    assert list(index.query(np.array([4.6]), 3)) == [6, 3, 7]
+
+    # rebuilds the tree without the removed records
+    index.remove(np.array([0, 1, 2, 3]))
+    assert len(index.positions) == 4
+    assert list(index.query(np.array([0.0]), 2)) == [6, 7]
+
+def test_mixed_distances_blocks_match_single_pass():
+    rng = np.random.default_rng(3)
+    values = rng.normal(size=(1000, 3)).astype(np.float32)
+    codes = rng.integers(-1, 4, size=(1000, 2)).astype(np.int8)
+    centre, centre_codes = values[0], codes[0]
+
+    expected = np.sqrt(((values - centre) ** 2).sum(axis=1)) + (codes != centre_codes).sum(axis=1)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        actual = mixed_distances(values, codes, centre, centre_codes, block_size=128, executor=executor)
+
+    assert actual.dtype == np.float32
+    assert np.allclose(actual, expected, atol=1e-5)
+
+def test_threaded_blocked_MDAV_matches_single_thread():
+    rng = np.random.default_rng(4)
+    df = pd.DataFrame(rng.normal(size=(400, 3)), columns=["a", "b", "c"], index=rng.permutation(400))
+    df["d"] = pd.Categorical(rng.choice(list("wxyz"), 400))
+    # rule out random tie-breaks between equally frequent modes
+    df.loc[df.index[:200], "d"] = "w"
+
+    for algorithm in (MDAVGeneric, FMDAV):
+        single = algorithm(3, ["a", "b", "c", "d"]).partition(df)
+        threaded = algorithm(3, ["a", "b", "c", "d"], n_jobs=2, block_size=64).partition(df)
+        assert [sorted(c) for c in single] == [sorted(c) for c in threaded]
+
+def test_blocked_microaggregation_clusters_within_blocks():
+    rng = np.random.default_rng(5)
+    df = pd.DataFrame(rng.normal(size=(1000, 2)), columns=["a", "b"], index=rng.permutation(1000))
+    df["c"] = pd.Categorical(rng.choice(["x", "y"], 1000))
+    blocked = BlockedMicroaggregation(3, ["a", "b", "c"], block_size=150)
+
+    blocks = blocked._split(df)
+    assert all(75 <= len(block) <= 150 for block in blocks)
+    assert sorted(np.concatenate(blocks)) == list(range(1000))
+
+    clusters = blocked.partition(df)
+    assert sorted(np.concatenate(clusters)) == sorted(df.index)
+    assert all(len(cluster) >= 3 for cluster in clusters)
+
+    parallel = BlockedMicroaggregation(3, ["a", "b", "c"], block_size=150, algorithm=FMDAV, n_jobs=2).partition(df)
+    assert sorted(np.concatenate(parallel)) == sorted(df.index)
+    assert all(len(cluster) >= 3 for cluster in parallel)
+
+def test_blocked_microaggregation_matches_single_block():
+    rng = np.random.default_rng(6)
+    df = pd.DataFrame(rng.normal(size=(200, 3)), columns=["a", "b", "c"])
+
+    blocked = BlockedMicroaggregation(3, ["a", "b", "c"], block_size=200).partition(df)
+    expected = MDAVGeneric(3, ["a", "b", "c"]).partition(df)
+
+    assert [sorted(c) for c in blocked] == [sorted(c) for c in expected]
+    with pytest.raises(ValueError):
+        BlockedMicroaggregation(3, ["a"], block_size=5)
+
+def test_MDAVGeneric_modes_follow_removed_clusters():
+    df = pd.DataFrame({
+        "a": pd.Categorical(["x", "x", "y", None, "y", "y"]),
+        "b": pd.Categorical([None] * 6, categories=["u"]),
+    })
+    mdav = MDAVGeneric(2, ["a", "b"])
+    mdav._prepare_data(df)
+    mdav.clusters = []
+
+    # codes follow the order of appearance: x = 0, y = 1
+    assert list(mdav._find_modes()) == [1, -1]
+
+    mdav._remove_cluster(np.array([2, 4]))
+    assert list(mdav._find_modes()) == [0, -1]
+
+    mdav._remove_cluster(np.array([0, 1]))
+    assert list(mdav._find_modes()) == [1, -1]
+
+def test_algorithms_accept_plain_arrays():
+    rng = np.random.default_rng(7)
+    values = rng.normal(size=(300, 4)).astype(np.float32)
+    df = pd.DataFrame(values)
+
+    for algorithm in (MDAVGeneric, FMDAV):
+        from_array = algorithm(3, range(4)).partition(values)
+        from_frame = algorithm(3, df.columns).partition(df)
+        assert all(isinstance(cluster, np.ndarray) for cluster in from_array)
+        assert [sorted(c) for c in from_array] == [sorted(c) for c in from_frame]
+
+    # selects columns by position
+    subset = MDAVGeneric(3, [0, 2]).partition(values)
+    assert [sorted(c) for c in subset] == [sorted(c) for c in MDAVGeneric(3, [0, 2]).partition(df)]
+
+    for algorithm in (
+        RandomChoiceAggregation(3, range(4)),
+        RandomChoiceAggregation(3, range(4), neighbours="kd-tree"),
+        BlockedMicroaggregation(3, range(4), block_size=50),
+    ):
+        clusters = algorithm.partition(values)
+        assert sorted(np.concatenate(clusters)) == list(range(300))
+        assert all(len(cluster) >= 3 for cluster in clusters)
+    assert values.dtype == np.float32 and np.array_equal(values, df.to_numpy())
@@ -1,6 +1,7 @@
 import anonypyx
 from anonypyx import models
 
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -100,3 +101,137 @@ def test_t_closeness_no_sensitive_attribute(t_closeness_df):
     df = t_closeness_df.loc[[0, 2]] 
     sensitive_column = None
     assert not (models.tCloseness(0.5, t_closeness_df, sensitive_column, models.earth_movers_distance_categorical).is_enforcable(df))
+
+def summarise(df, sensitive_column):
+    return models.PartitionSummary.from_frame(df, {sensitive_column: models.sensitive_domain(df[sensitive_column])})
+
+def test_partition_summary_counts_sensitive_values(t_closeness_df):
+    summary = summarise(t_closeness_df, "col3")
+
+    assert summary.count == 6
+    assert list(summary.domains["col3"]) == ["1", "2", "3", "4"]
+    assert list(summary.histograms["col3"]) == [2, 1, 2, 1]
+
+def test_partition_summary_difference(t_closeness_df):
+    parent = summarise(t_closeness_df, "col3")
+    child = models.PartitionSummary.from_frame(t_closeness_df.loc[[0, 2]], parent.domains)
+
+    sibling = parent - child
+
+    assert sibling.count == 4
+    assert list(sibling.histograms["col3"]) == [1, 0, 2, 1]
+
+def test_k_anonymity_summary(k_anonymity_df):
+    summary = summarise(k_anonymity_df, "col3")
+    assert models.kAnonymity(3).is_enforcable_summary(summary)
+    assert not models.kAnonymity(4).is_enforcable_summary(summary)
+
+def test_distinct_l_diversity_summary(distinct_l_diversity_df):
+    summary = summarise(distinct_l_diversity_df, "col3")
+    assert models.DistinctLDiversity(3, "col3").is_enforcable_summary(summary)
+    assert not models.DistinctLDiversity(4, "col3").is_enforcable_summary(summary)
+
+def test_distinct_l_diversity_summary_counts_missing_values_like_data_frame():
+    df = pd.DataFrame({"col3": pd.Categorical(["a", "a", None, None])})
+    summary = summarise(df, "col3")
+
+    for l in (1, 2, 3):
+        model = models.DistinctLDiversity(l, "col3")
+        assert model.is_enforcable_summary(summary) == model.is_enforcable(df)
+    assert models.DistinctLDiversity(2, "col3").is_enforcable_summary(summary)
+
+def test_t_closeness_summary_agrees_with_data_frame(t_closeness_df):
+    domains = {"col3": models.sensitive_domain(t_closeness_df["col3"])}
+    summary = models.PartitionSummary.from_frame(t_closeness_df.loc[[0, 2]], domains)
+
+    for t in (1.99/6.0, 2.01/6.0):
+        model = models.tCloseness(t, t_closeness_df, "col3", models.max_distance_metric)
+        assert model.is_enforcable_summary(summary) == model.is_enforcable(t_closeness_df.loc[[0, 2]])
+
+def test_entropy_l_diversity(distinct_l_diversity_df):
+    # counts 2, 2, 1: entropy lies between log(2) and log(3)
+    assert models.EntropyLDiversity(2, "col3").is_enforcable(distinct_l_diversity_df)
+    assert not models.EntropyLDiversity(3, "col3").is_enforcable(distinct_l_diversity_df)
+
+def test_entropy_l_diversity_accepts_uniform_distribution(distinct_l_diversity_df):
+    df = distinct_l_diversity_df.loc[[0, 2, 4]]
+    assert models.EntropyLDiversity(3, "col3").is_enforcable(df)
+    assert models.EntropyLDiversity(3, "col3").is_enforcable_summary(summarise(df, "col3"))
+
+def test_recursive_cl_diversity(distinct_l_diversity_df):
+    # counts 2, 2, 1: r_1 = 2 and r_2 + r_3 = 3, r_3 = 1
+    assert models.RecursiveCLDiversity(0.7, 2, "col3").is_enforcable(distinct_l_diversity_df)
+    assert not models.RecursiveCLDiversity(0.6, 2, "col3").is_enforcable(distinct_l_diversity_df)
+    assert models.RecursiveCLDiversity(2.1, 3, "col3").is_enforcable(distinct_l_diversity_df)
+    assert not models.RecursiveCLDiversity(2.0, 3, "col3").is_enforcable(distinct_l_diversity_df)
+    assert not models.RecursiveCLDiversity(100.0, 4, "col3").is_enforcable(distinct_l_diversity_df)
+
+@pytest.mark.parametrize("model", [
+    models.EntropyLDiversity(2, "col3"),
+    models.EntropyLDiversity(3, "col3"),
+    models.RecursiveCLDiversity(0.7, 2, "col3"),
+    models.RecursiveCLDiversity(2.0, 3, "col3"),
+])
+def test_l_diversity_summary_agrees_with_data_frame(distinct_l_diversity_df, model):
+    domains = {"col3": models.sensitive_domain(distinct_l_diversity_df["col3"])}
+    for rows in ([0, 1, 2, 3, 4], [0, 2, 4], [0, 1, 4], [0, 1]):
+        df = distinct_l_diversity_df.loc[rows]
+        summary = models.PartitionSummary.from_frame(df, domains)
+        assert model.is_enforcable_summary(summary) == model.is_enforcable(df)
+
+def test_l_diversity_variants_without_sensitive_attribute(distinct_l_diversity_df):
+    assert not models.EntropyLDiversity(1, None).is_enforcable(distinct_l_diversity_df)
+    assert not models.RecursiveCLDiversity(2.0, 1, None).is_enforcable(distinct_l_diversity_df)
+
+def test_ordered_earth_movers_distance():
+    # example from Li et al., t-closeness: privacy beyond k-anonymity and l-diversity
+    salaries = pd.DataFrame({"salary": [3, 4, 5, 6, 7, 8, 9, 10, 11]})
+    model = models.tCloseness(0.375, salaries, "salary", models.earth_movers_distance_ordered)
+
+    assert model.is_enforcable(salaries.loc[[0, 1, 2]])
+    assert not models.tCloseness(0.374, salaries, "salary", models.earth_movers_distance_ordered).is_enforcable(salaries.loc[[0, 1, 2]])
+    # a class spread over the whole range is closer to the global distribution
+    assert model.is_enforcable(salaries.loc[[0, 4, 8]])
+
+@pytest.mark.parametrize("dtype", ["object", "category"])
+def test_t_closeness_counts_values_missing_from_class(dtype):
+    df = pd.DataFrame({"s": pd.Series(["a", "a", "b", "b", "c", "c"], dtype=dtype)})
+    cls = df.iloc[[0, 2]]
+    model = models.tCloseness(0.3, df, "s", models.earth_movers_distance_categorical)
+
+    # 0.5 * (1/6 + 1/6 + 1/3): the global mass of "c" counts although "c" is not part of the class
+    assert not model.is_enforcable(cls)
+    assert not model.is_enforcable_summary(summarise(cls, "s"))
+    assert models.tCloseness(0.34, df, "s", models.earth_movers_distance_categorical).is_enforcable(cls)
+
+def test_t_closeness_passes_dicts_to_custom_metrics(t_closeness_df):
+    received = []
+    def custom_metric(distribution1, distribution2):
+        received.append((distribution1, distribution2))
+        return max(abs(f1 - distribution2[value]) for value, f1 in distribution1.items())
+
+    model = models.tCloseness(2.01/6.0, t_closeness_df, "col3", custom_metric)
+    reference = models.tCloseness(2.01/6.0, t_closeness_df, "col3", models.max_distance_metric)
+    df = t_closeness_df.iloc[:3]
+
+    assert model.is_enforcable(df) == reference.is_enforcable(df)
+    assert model.is_enforcable_summary(summarise(df, "col3")) == reference.is_enforcable_summary(summarise(df, "col3"))
+    local, global_ = received[0]
+    assert isinstance(local, dict) and isinstance(global_, dict)
+    assert set(local) == set(global_) == set(t_closeness_df["col3"].dropna())
+
+def test_metrics_accept_dicts_and_arrays():
+    dist1 = {"A": 0.2, "B": 0.3, "C": 0.5}
+    dist2 = {"A": 0.5, "B": 0.3, "C": 0.2}
+    array1, array2 = np.array(list(dist1.values())), np.array(list(dist2.values()))
+
+    for metric in (models.max_distance_metric, models.earth_movers_distance_categorical, models.earth_movers_distance_ordered):
+        assert pytest.approx(metric(dist1, dist2)) == metric(array1, array2)
+    assert pytest.approx(0.3) == models.earth_movers_distance_ordered(array1, array2)
+
+def test_t_closeness_summary_aligns_foreign_domain(t_closeness_df):
+    model = models.tCloseness(1.99/6.0, t_closeness_df, "col3", models.max_distance_metric)
+    df = t_closeness_df.loc[[0, 2]]
+    summary = models.PartitionSummary.from_frame(df, {"col3": pd.Index(["2", "1"])})
+
+    assert model.is_enforcable_summary(summary) == model.is_enforcable(df)
@@ -1,7 +1,11 @@
 import anonypyx
 from anonypyx import models
 from anonypyx.algorithms import mondrian
+import json
+
+import numpy as np
 import pandas as pd
+import pytest
 
 data = [
     [6, "1", "test1", "x", 20],
@@ -59,3 +63,370 @@ def test_t_closeness():
 
     print(f"partitions: {partitions}")
 
+
+class ReferenceMondrian:
+    # the original pandas-based implementation, kept to verify that the array engine is equivalent
+    def __init__(self, privacy_models, feature_columns):
+        self._privacy_models = privacy_models
+        self._feature_columns = feature_columns
+
+    def _get_spans(self, df, partition, scale=None):
+        spans = {}
+        for column in self._feature_columns:
+            if df[column].dtype.name == "category":
+                span = len(df[column][partition].unique())
+            else:
+                span = df[column][partition].max() - df[column][partition].min()
+            if scale is not None:
+                span = span / scale[column]
+            spans[column] = span
+        return spans
+
+    def _split(self, df, column, partition):
+        dfp = df[column][partition]
+        if dfp.dtype.name == "category":
+            values = dfp.unique()
+            lv = set(values[: len(values) // 2])
+            rv = set(values[len(values) // 2 :])
+            return dfp.index[dfp.isin(lv)], dfp.index[dfp.isin(rv)]
+        median = dfp.median()
+        return dfp.index[dfp < median], dfp.index[dfp >= median]
+
+    def partition(self, df):
+        scale = self._get_spans(df, df.index)
+        finished_partitions = []
+        partitions = [df.index]
+
+        while partitions:
+            partition = partitions.pop(0)
+            normalized_spans = self._get_spans(df, partition, scale)
+            for column, span in sorted(normalized_spans.items(), key=lambda x: -x[1]):
+                left_part, right_part = self._split(df, column, partition)
+                if all(model.is_enforcable(df.loc[left_part]) and model.is_enforcable(df.loc[right_part]) for model in self._privacy_models):
+                    partitions.extend((left_part, right_part))
+                    break
+            else:
+                finished_partitions.append(partition)
+        return finished_partitions
+
+def random_df(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "age": rng.integers(17, 90, n),
+        "income": rng.normal(50000, 15000, n).round(2),
+        "sex": pd.Categorical(rng.choice(["female", "male", "intersex"], n)),
+        "zip": pd.Categorical(rng.choice([f"{z:05d}" for z in range(20)], n)),
+        "diagnosis": pd.Categorical(rng.choice(["flu", "stroke", "cancer", "diabetes", "asthma"], n)),
+    }, index=rng.permutation(n) + 1000)
+    return df
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_reference_implementation(seed):
+    df = random_df(400, seed)
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [
+        models.kAnonymity(4),
+        models.DistinctLDiversity(2, "diagnosis"),
+        models.tCloseness(0.4, df, "diagnosis", models.max_distance_metric),
+    ]
+
+    expected = ReferenceMondrian(privacy_models, feature_columns).partition(df)
+    actual = mondrian.Mondrian(privacy_models, feature_columns).partition(df)
+
+    assert [list(p) for p in expected] == [list(p) for p in actual]
+
+def test_parallel_partition_matches_serial():
+    df = random_df(1000, 3)
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(3), models.DistinctLDiversity(2, "diagnosis")]
+
+    expected = mondrian.Mondrian(privacy_models, feature_columns).partition(df)
+    actual = mondrian.Mondrian(privacy_models, feature_columns, n_jobs=2, parallel_threshold=50).partition(df)
+
+    assert [list(p) for p in expected] == [list(p) for p in actual]
+
+@pytest.mark.parametrize("presort", [True, False])
+def test_matches_reference_implementation_with_missing_values(presort):
+    df = random_df(300, 4)
+    df.loc[df.sample(frac=0.1, random_state=0).index, "income"] = np.nan
+    feature_columns = ["age", "income", "sex"]
+    privacy_models = [models.kAnonymity(3)]
+
+    expected = ReferenceMondrian(privacy_models, feature_columns).partition(df)
+    actual = mondrian.Mondrian(privacy_models, feature_columns, presort=presort).partition(df)
+
+    assert [list(p) for p in expected] == [list(p) for p in actual]
+
+@pytest.mark.parametrize("presort", [True, False])
+def test_matches_reference_implementation_with_missing_datetimes(presort):
+    df = random_df(300, 5)
+    df["admitted"] = pd.Timestamp("2020-01-01") + pd.to_timedelta(df["income"].round(), unit="min")
+    df.loc[df.sample(frac=0.1, random_state=1).index, "admitted"] = pd.NaT
+    feature_columns = ["age", "admitted", "sex"]
+    privacy_models = [models.kAnonymity(3)]
+
+    expected = ReferenceMondrian(privacy_models, feature_columns).partition(df)
+    actual = mondrian.Mondrian(privacy_models, feature_columns, presort=presort).partition(df)
+
+    assert [list(p) for p in expected] == [list(p) for p in actual]
+
+@pytest.mark.parametrize("presort", [True, False])
+def test_empty_data_frame_forms_one_empty_partition(presort):
+    df = random_df(10).iloc[:0]
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(2), models.DistinctLDiversity(1, "diagnosis")]
+    m = mondrian.Mondrian(privacy_models, feature_columns, presort=presort)
+
+    assert [list(p) for p in m.partition(df)] == [[]]
+    assert [list(p) for p in m.partition(df, max_splits=5)] == [[]]
+    assert [list(p) for p in m.iter_partitions(df)] == [[]]
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_t_closeness_does_not_depend_on_sensitive_dtype(seed):
+    df = random_df(300, seed)
+    feature_columns = ["age", "income", "sex", "zip"]
+    objects = df.assign(diagnosis=df["diagnosis"].astype(object))
+
+    partitions = []
+    for data in (df, objects):
+        privacy_models = [models.kAnonymity(2), models.tCloseness(0.3, data, "diagnosis", models.earth_movers_distance_categorical)]
+        partitions.append([list(p) for p in mondrian.Mondrian(privacy_models, feature_columns).partition(data)])
+
+    assert partitions[0] == partitions[1]
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_reference_implementation_with_missing_sensitive_values(seed):
+    df = random_df(300, seed)
+    df.loc[df.sample(frac=0.2, random_state=seed).index, "diagnosis"] = np.nan
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(2), models.DistinctLDiversity(3, "diagnosis")]
+
+    expected = ReferenceMondrian(privacy_models, feature_columns).partition(df)
+    actual = mondrian.Mondrian(privacy_models, feature_columns).partition(df)
+
+    assert [list(p) for p in expected] == [list(p) for p in actual]
+
+def test_presorting_does_not_change_partitions():
+    df = random_df(1000, 5)
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(5), models.DistinctLDiversity(2, "diagnosis")]
+
+    expected = mondrian.Mondrian(privacy_models, feature_columns, presort=False).partition(df)
+    actual = mondrian.Mondrian(privacy_models, feature_columns, presort=True).partition(df)
+
+    assert [list(p) for p in expected] == [list(p) for p in actual]
+
+def test_sketch_threshold_above_data_size_uses_exact_medians():
+    df = random_df(500, 6)
+    feature_columns = ["age", "income", "sex"]
+    privacy_models = [models.kAnonymity(3)]
+
+    expected = mondrian.Mondrian(privacy_models, feature_columns).partition(df)
+    actual = mondrian.Mondrian(privacy_models, feature_columns, sketch_threshold=500, sketch_size=10).partition(df)
+
+    assert [list(p) for p in expected] == [list(p) for p in actual]
+
+@pytest.mark.parametrize("presort", [True, False])
+def test_approximate_medians_produce_valid_partitioning(presort):
+    df = random_df(2000, 7)
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(4), models.DistinctLDiversity(2, "diagnosis")]
+
+    partitions = mondrian.Mondrian(privacy_models, feature_columns, presort=presort, sketch_threshold=100, sketch_size=16).partition(df)
+
+    assert sorted(label for partition in partitions for label in partition) == sorted(df.index)
+    for partition in partitions:
+        assert all(model.is_enforcable(df.loc[partition]) for model in privacy_models)
+
+def test_approximate_medians_do_not_depend_on_presorting():
+    df = random_df(2000, 8)
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(4)]
+
+    expected = mondrian.Mondrian(privacy_models, feature_columns, presort=False, sketch_threshold=100, sketch_size=16).partition(df)
+    actual = mondrian.Mondrian(privacy_models, feature_columns, presort=True, sketch_threshold=100, sketch_size=16).partition(df)
+
+    assert [list(p) for p in expected] == [list(p) for p in actual]
+
+@pytest.mark.parametrize("presort", [True, False])
+def test_partition_to_disk_matches_in_memory_partitioning(tmp_path, presort):
+    df = random_df(1000, 9)
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(3), models.DistinctLDiversity(2, "diagnosis")]
+    m = mondrian.Mondrian(privacy_models, feature_columns, presort=presort)
+
+    mondrian.EncodedFrame.from_frame(df, feature_columns, ["diagnosis"]).save(tmp_path / "encoded")
+    data = mondrian.EncodedFrame.load(tmp_path / "encoded")
+    count = m.partition_to_disk(data, tmp_path / "labels.npy")
+
+    labels = np.load(tmp_path / "labels.npy")
+    actual = pd.Series(df.index).groupby(labels).apply(list).to_list()
+    expected = [list(p) for p in m.partition(df)]
+
+    assert isinstance(data.values["age"], np.memmap)
+    assert count == len(expected)
+    assert sorted(actual) == sorted(expected)
+
+def test_partition_to_disk_skips_presorting_and_uses_approximate_medians(tmp_path, monkeypatch):
+    df = random_df(1000, 9)
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(3), models.DistinctLDiversity(2, "diagnosis")]
+    m = mondrian.Mondrian(privacy_models, feature_columns, presort=True, sketch_size=16)
+
+    roots = []
+    root = mondrian.Mondrian._root
+    def recording_root(self, *args, **kwargs):
+        result = root(self, *args, **kwargs)
+        roots.append(result[0])
+        return result
+    monkeypatch.setattr(mondrian.Mondrian, "_root", recording_root)
+
+    mondrian.EncodedFrame.from_frame(df, feature_columns, ["diagnosis"]).save(tmp_path / "encoded")
+    data = mondrian.EncodedFrame.load(tmp_path / "encoded")
+    m.partition_to_disk(data, tmp_path / "labels.npy")
+
+    labels = np.load(tmp_path / "labels.npy")
+    actual = pd.Series(df.index).groupby(labels).apply(list).to_list()
+    sketched = mondrian.Mondrian(privacy_models, feature_columns, presort=False, sketch_threshold=16, sketch_size=16)
+    expected = [list(p) for p in sketched.partition(df)]
+
+    # the orders of the root node are None unless the columns were presorted
+    assert roots[0][4] is None
+    assert sorted(actual) == sorted(expected)
+    assert sorted(actual) != sorted(list(p) for p in mondrian.Mondrian(privacy_models, feature_columns).partition(df))
+
+def test_partition_to_disk_requires_summary_models(tmp_path):
+    class DataFrameModel:
+        def is_enforcable(self, df):
+            return True
+
+    data = mondrian.EncodedFrame.from_frame(random_df(10), ["age"])
+
+    with pytest.raises(TypeError):
+        mondrian.Mondrian([DataFrameModel()], ["age"]).partition_to_disk(data, tmp_path / "labels.npy")
+
+def test_iter_partitions_yields_same_partitions_depth_first():
+    df = random_df(1000, 10)
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(3), models.DistinctLDiversity(2, "diagnosis")]
+    m = mondrian.Mondrian(privacy_models, feature_columns)
+
+    expected = [list(p) for p in m.partition(df)]
+    generator = m.iter_partitions(df)
+    first = next(generator)
+    actual = [list(first)] + [list(p) for p in generator]
+
+    assert sorted(actual) == sorted(expected)
+
+def test_iter_partitions_can_be_generalised():
+    df = random_df(200, 11)
+    feature_columns = ["age", "sex"]
+    m = mondrian.Mondrian([models.kAnonymity(5)], feature_columns)
+    schema = anonypyx.generalisation.MachineReadable.create_for_data(df, feature_columns)
+
+    expected = schema.generalise(df, m.partition(df))
+    actual = schema.generalise(df, m.iter_partitions(df))
+
+    assert expected["count"].sum() == actual["count"].sum() == len(df)
+    assert len(expected) == len(actual)
+
+@pytest.fixture
+def tree_setup():
+    df = random_df(1000, 12)
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(4), models.DistinctLDiversity(2, "diagnosis")]
+    partitions, tree = mondrian.Mondrian(privacy_models, feature_columns).partition(df, return_tree=True)
+    return df, privacy_models, partitions, tree
+
+def test_split_tree_routes_partitioned_rows_to_their_class(tree_setup):
+    df, _, partitions, tree = tree_setup
+
+    labels = tree.route(df)
+
+    assert len(tree.leaves) == len(partitions)
+    for i, partition in enumerate(partitions):
+        assert (labels[df.index.get_indexer(partition)] == i).all()
+        assert tree.leaves[i].summary.count == len(partition)
+
+def test_split_tree_survives_serialisation(tree_setup):
+    df, _, _, tree = tree_setup
+    new_records = random_df(300, 13)
+
+    json_dict = json.loads(json.dumps(tree.to_json_dict()))
+    restored = mondrian.SplitTree.from_json_dict(json_dict)
+
+    assert (restored.route(new_records) == tree.route(new_records)).all()
+    assert restored.to_json_dict() == tree.to_json_dict()
+
+def test_split_tree_revalidates_changed_leaves(tree_setup):
+    df, privacy_models, partitions, tree = tree_setup
+    assert tree.revalidate(privacy_models) == []
+
+    # a batch of new records with a single diagnosis keeps every changed leaf l-diverse
+    new_records = random_df(50, 14)
+    labels = tree.add(new_records)
+    assert tree.revalidate(privacy_models) == []
+    assert sum(leaf.summary.count for leaf in tree.leaves) == 1050
+
+    # t-closeness is violated once a leaf receives many records with the same diagnosis
+    target = labels[0]
+    skewed = pd.concat([new_records.iloc[[0]]] * 200)
+    model = models.tCloseness(0.5, df, "diagnosis", models.max_distance_metric)
+    tree.add(skewed)
+    assert tree.revalidate([model]) == [target]
+    assert tree.revalidate([model]) == []
+
+def test_parallel_split_tree_matches_serial():
+    df = random_df(1000, 15)
+    feature_columns = ["age", "income", "sex", "zip"]
+    privacy_models = [models.kAnonymity(3), models.DistinctLDiversity(2, "diagnosis")]
+
+    _, expected = mondrian.Mondrian(privacy_models, feature_columns).partition(df, return_tree=True)
+    _, actual = mondrian.Mondrian(privacy_models, feature_columns, n_jobs=2, parallel_threshold=50).partition(df, return_tree=True)
+
+    assert expected.to_json_dict() == actual.to_json_dict()
+
+def test_generous_budget_completes_partitioning():
+    df = random_df(500, seed=6)
+    m = mondrian.Mondrian([models.kAnonymity(3)], ["age", "income", "sex", "zip"])
+
+    expected = m.partition(df)
+    partitions = m.partition(df, time_budget=60.0, max_splits=10**6)
+
+    assert expected.completed and partitions.completed
+    assert [list(p) for p in partitions] == [list(p) for p in expected]
+
+@pytest.mark.parametrize("max_splits", [0, 1, 7, 40])
+def test_max_splits_stops_early_with_valid_partitioning(max_splits):
+    df = random_df(500, seed=7)
+    k_anonymity = models.kAnonymity(3)
+    m = mondrian.Mondrian([k_anonymity], ["age", "income", "sex", "zip"])
+
+    partitions, tree = m.partition(df, return_tree=True, max_splits=max_splits)
+
+    assert not partitions.completed
+    assert len(partitions) == max_splits + 1
+    assert sorted(np.concatenate([p.to_numpy() for p in partitions])) == sorted(df.index)
+    assert all(k_anonymity.is_enforcable(df.loc[p]) for p in partitions)
+    labels = pd.Series(tree.route(df), index=df.index)
+    for i, partition in enumerate(partitions):
+        assert (labels[partition] == i).all()
+
+def test_early_stop_splits_widest_partitions_first():
+    df = random_df(2000, seed=8)
+    m = mondrian.Mondrian([models.kAnonymity(3)], ["age", "income"])
+
+    partitions = m.partition(df, max_splits=15)
+
+    # the widest classes are split first, so no class is left much wider than the others
+    widths = [df.loc[p, "age"].max() - df.loc[p, "age"].min() for p in partitions]
+    assert max(widths) <= 2 * min(widths) + 1
+
+def test_zero_time_budget_returns_single_partition():
+    df = random_df(100, seed=9)
+    m = mondrian.Mondrian([models.kAnonymity(3)], ["age", "income"])
+
+    partitions = m.partition(df, time_budget=0)
+
+    assert not partitions.completed
+    assert len(partitions) == 1